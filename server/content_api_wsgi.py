@@ -0,0 +1,26 @@
+# -*- coding: utf-8; -*-
+#
+# This file is part of Superdesk.
+#
+# Copyright 2013, 2014, 2015 Sourcefabric z.u. and contributors.
+#
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+
+"""Content API with the tga apps
+
+The content API only takes the settings it defines itself from ``settings.py``,
+so the settings of the tga apps are passed explicitly.
+"""
+
+import settings
+
+from content_api.app import get_app
+from content_api.app.settings import CONTENTAPI_INSTALLED_APPS
+
+config = {key: getattr(settings, key) for key in dir(settings) if key.startswith("DOI_RESOLVER_")}
+config["REDIS_URL"] = settings.REDIS_URL
+config["CONTENTAPI_INSTALLED_APPS"] = CONTENTAPI_INSTALLED_APPS + ["tga.doi_resolver.api"]
+
+application = get_app(config)
@@ -9,10 +9,14 @@
 # at https://www.sourcefabric.org/superdesk/license
 
 
-from superdesk.tests.environment import before_feature, before_step, after_scenario   # noqa
+from superdesk.tests import environment
+from superdesk.tests.environment import before_step, after_scenario   # noqa
 from superdesk.tests.environment import setup_before_all, setup_before_scenario
 from app import get_app
 from settings import INSTALLED_APPS
+from tests import fast_setup
+
+fast_setup.install()
 
 
 def before_all(context):
@@ -23,9 +27,25 @@ def before_all(context):
     setup_before_all(context, config, app_factory=get_app)
 
 
+def before_feature(context, feature):
+    with fast_setup.timer.measure():
+        if fast_setup.is_enabled():
+            fast_setup.before_feature(context, feature)
+        else:
+            environment.before_feature(context, feature)
+
+
 def before_scenario(context, scenario):
     config = {
         'INSTALLED_APPS': INSTALLED_APPS,
         'ELASTICSEARCH_FORCE_REFRESH': True,
     }
-    setup_before_scenario(context, scenario, config, app_factory=get_app)
+    with fast_setup.timer.measure(scenario=True):
+        if fast_setup.is_enabled():
+            fast_setup.setup_before_scenario(context, scenario, config, app_factory=get_app)
+        else:
+            setup_before_scenario(context, scenario, config, app_factory=get_app)
+
+
+def after_all(context):
+    fast_setup.timer.report()
@@ -9,3 +9,12 @@ access_log_format = "%(m)s %(U)s status=%(s)s time=%(T)ss size=%(B)sb"
 
 reload = 'SUPERDESK_RELOAD' in os.environ
 timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+
+
+def post_worker_init(worker):
+    # the app is only loaded in the worker after ``post_fork``
+    from tga.warmup import warm_up
+
+    app = getattr(worker, "wsgi", None)
+    if hasattr(app, "app_context"):
+        warm_up(app)
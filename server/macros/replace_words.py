@@ -13,80 +13,126 @@ import re
 from superdesk import get_resource_service
 from superdesk.macros import macro_replacement_fields
 
+# vocabulary items and compiled patterns of the last ``get_compiled_words`` call
+_compiled_words = None
 
-def find_and_replace(item, **kwargs):
+
+def repl(new, old):
     """
-    Find and replace words
+    Returns a version of the "new" string that matches the case of the "old" string
+    :param new:
+    :param old:
+    :return: a string which is a version of "new" that matches the case of old.
+    """
+    if old.islower():
+        return new.lower()
+    elif old.isupper():
+        return new.upper()
+    else:
+        # the old string starts with upper case so we use the title function
+        if old[:1].isupper():
+            return new.title()
+        # it is more complex so try to match it
+        else:
+            result = ''
+            all_upper = True
+            for i, c in enumerate(old):
+                if i >= len(new):
+                    break
+                if c.isupper():
+                    result += new[i].upper()
+                else:
+                    result += new[i].lower()
+                    all_upper = False
+            # append any remaining characters from new
+            if all_upper:
+                result += new[i + 1:].upper()
+            else:
+                result += new[i + 1:].lower()
+            return result
+
+
+def compile_words(words_list):
+    """
+    Compile the patterns of the replace_words vocabulary items
+    :param list words_list: vocabulary items with ``existing`` and ``replacement``
+    :return list: list of (compiled pattern, replacement) tuples
+    """
+    return [
+        (re.compile(re.escape(word.get('existing', '')), flags=re.IGNORECASE), word.get('replacement', ''))
+        for word in words_list
+    ]
+
+
+def get_compiled_words(words_list):
+    """
+    Return the compiled patterns of the words, compiled again only when the vocabulary changes
+    :param list words_list: vocabulary items with ``existing`` and ``replacement``
+    :return list: output of ``compile_words``
+    """
+    global _compiled_words
+    key = tuple((word.get('existing', ''), word.get('replacement', '')) for word in words_list)
+    cached = _compiled_words
+    if cached is None or cached[0] != key:
+        cached = _compiled_words = (key, compile_words(words_list))
+    return cached[1]
+
+
+def do_find_replace(input_string, compiled_words, diff):
+    found_list = {}
+    for pattern, replacement in compiled_words:
+        match = pattern.search(input_string)
+        while match:
+            # get the original string from the input
+            original = match.group(0)
+            if found_list.get(original):
+                break
+            diff[original] = found_list[original] = repl(replacement, original)
+            input_string = input_string.replace(original, found_list[original])
+            match = pattern.search(input_string)
+
+    return input_string
+
+
+def replace_in_item(item, compiled_words):
+    """
+    Apply the compiled words to the macro replacement fields of the item
     :param dict item:
-    :param kwargs:
-    :return tuple(dict, dict): tuple of modified item and diff of items modified.
+    :param list compiled_words: output of ``compile_words``
+    :return tuple(dict, dict): tuple of updated fields and diff of words replaced.
     """
     diff = {}
+    updates = {}
+    for field in macro_replacement_fields:
+        if not item.get(field, None):
+            continue
 
-    def repl(new, old):
-        """
-        Returns a version of the "new" string that matches the case of the "old" string
-        :param new:
-        :param old:
-        :return: a string which is a version of "new" that matches the case of old.
-        """
-        if old.islower():
-            return new.lower()
-        elif old.isupper():
-            return new.upper()
-        else:
-            # the old string starts with upper case so we use the title function
-            if old[:1].isupper():
-                return new.title()
-            # it is more complex so try to match it
-            else:
-                result = ''
-                all_upper = True
-                for i, c in enumerate(old):
-                    if i >= len(new):
-                        break
-                    if c.isupper():
-                        result += new[i].upper()
-                    else:
-                        result += new[i].lower()
-                        all_upper = False
-                # append any remaining characters from new
-                if all_upper:
-                    result += new[i + 1:].upper()
-                else:
-                    result += new[i + 1:].lower()
-                return result
-
-    def do_find_replace(input_string, words_list):
-        found_list = {}
-        for word in words_list:
-            pattern = r'{}'.format(re.escape(word.get('existing', '')))
-
-            while re.search(pattern, input_string, flags=re.IGNORECASE):
-                # get the original string from the input
-                original = re.search(pattern, input_string, flags=re.IGNORECASE).group(0)
-                replacement = repl(word.get('replacement', ''), original)
-                if found_list.get(original):
-                    break
-                diff[original] = replacement
-                found_list[original] = replacement
-                input_string = input_string.replace(original, replacement)
+        value = do_find_replace(item[field], compiled_words, diff)
+        if value != item[field]:
+            updates[field] = value
 
-        return input_string
+    return updates, diff
 
-    vocab = get_resource_service('vocabularies').find_one(req=None, _id='replace_words')
 
-    if vocab:
-        replace_words_list = vocab.get('items') or []
+def get_replace_words():
+    vocab = get_resource_service('vocabularies').find_one(req=None, _id='replace_words')
+    if not vocab:
+        return None
+    return vocab.get('items') or []
 
-        if not replace_words_list:
-            return item
 
-        for field in macro_replacement_fields:
-            if not item.get(field, None):
-                continue
+def find_and_replace(item, **kwargs):
+    """
+    Find and replace words
+    :param dict item:
+    :param kwargs:
+    :return dict: modified item.
+    """
+    replace_words_list = get_replace_words()
 
-            item[field] = do_find_replace(item[field], replace_words_list)
+    if replace_words_list:
+        updates, _diff = replace_in_item(item, get_compiled_words(replace_words_list))
+        item.update(updates)
 
     return item
 
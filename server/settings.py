@@ -10,7 +10,8 @@
 # at https://www.sourcefabric.org/superdesk/license
 
 from pathlib import Path
-from superdesk.default_settings import strtobool, env
+from kombu import Queue, Exchange
+from superdesk.default_settings import strtobool, env, celery_queue, CELERY_TASK_QUEUES, CELERY_TASK_ROUTES
 
 ABS_PATH = str(Path(__file__).resolve().parent)
 
@@ -20,6 +21,15 @@ if init_data.exists():
 
 WS_HOST = env("WSHOST", "0.0.0.0")
 WS_PORT = env("WSPORT", "5100")
+# Number of websocket server processes, each one receives every notification from the broker
+WS_PROCESSES = int(env("WS_PROCESSES", "1"))
+# Share ``WS_PORT`` between the processes using SO_REUSEPORT, otherwise use consecutive ports
+WS_REUSE_PORT = strtobool(env("WS_REUSE_PORT", "false"))
+# Events merged by the websocket server into a single notification, with window in seconds,
+# only for events with dict or list payloads, see tga.ws_coalescing
+WS_COALESCE_EVENTS = {
+    "content:update": 1,
+}
 
 LOG_CONFIG_FILE = env("LOG_CONFIG_FILE", "logging_config.yml")
 
@@ -28,6 +38,16 @@ if env("REDIS_PORT"):
     REDIS_URL = env("REDIS_PORT").replace("tcp:", "redis:")
 BROKER_URL = env("CELERY_BROKER_URL", REDIS_URL)
 
+CELERY_TASK_QUEUES = CELERY_TASK_QUEUES + (
+    Queue(celery_queue("slack"), Exchange(celery_queue("slack"), type="topic"), routing_key="slack.#"),
+)
+CELERY_TASK_ROUTES = dict(
+    CELERY_TASK_ROUTES,
+    **{
+        "tga.slack.*": {"queue": celery_queue("slack"), "routing_key": "slack.dispatch"},
+    },
+)
+
 DEFAULT_TIMEZONE = "Australia/Melbourne"
 DEFAULT_LANGUAGE = 'en'
 LANGUAGES = [
@@ -40,6 +60,10 @@ INSTALLED_APPS = [
     "analytics",
     "tga.signal_hooks",
     "tga.publish",
+    "tga.slack",
+    "tga.commands",
+    "tga.doi_resolver",
+    "tga.analytics_cache",
 ]
 
 MACROS_MODULE = env('MACROS_MODULE', 'macros')
@@ -148,6 +172,13 @@ ANALYTICS_ENABLE_SCHEDULED_REPORTS = strtobool(env("ANALYTICS_ENABLE_SCHEDULED_R
 HIGHCHARTS_SERVER_HOST = env('HIGHCHARTS_SERVER_HOST', 'localhost')
 HIGHCHARTS_SERVER_PORT = env('HIGHCHARTS_SERVER_PORT', '6060')
 
+# Cache of scheduled report results and charts in Redis, see ``tga.analytics_cache``
+ANALYTICS_CACHE_ENABLED = strtobool(env("ANALYTICS_CACHE_ENABLED", "true"))
+ANALYTICS_CACHE_TTL = int(env("ANALYTICS_CACHE_TTL", "3600"))
+# Seconds a report with a date filter ending now is cached for
+ANALYTICS_CACHE_NOW_WINDOW = int(env("ANALYTICS_CACHE_NOW_WINDOW", "300"))
+ANALYTICS_CACHE_LOCK_TIMEOUT = int(env("ANALYTICS_CACHE_LOCK_TIMEOUT", "120"))
+
 # Planning config
 # enable event templates
 PLANNING_EVENT_TEMPLATES_ENABLED = True
@@ -161,4 +192,49 @@ PLANNING_CHECK_FOR_ASSIGNMENT_ON_PUBLISH = True
 # The Bot User OAuth Token for access to Slack
 SLACK_BOT_TOKEN = env('SLACK_BOT_TOKEN', '')
 
+# Queue outgoing Slack messages and send them in batches from the ``slack`` Celery queue, consumed by
+# every worker started without ``-Q`` and by the ``slack`` process of the Procfile
+SLACK_DISPATCH_ENABLED = strtobool(env("SLACK_DISPATCH_ENABLED", "false"))
+# Seconds to wait for more messages to the same channel or user before sending
+SLACK_DISPATCH_WINDOW = float(env("SLACK_DISPATCH_WINDOW", "5"))
+SLACK_DISPATCH_MAX_LENGTH = int(env("SLACK_DISPATCH_MAX_LENGTH", "3000"))
+SLACK_API_URL = env("SLACK_API_URL", "https://slack.com/api/")
+
+# Max number of rendered Crossref documents cached by the formatter, 0 to disable
+CROSSREF_FORMATTER_CACHE_SIZE = int(env("CROSSREF_FORMATTER_CACHE_SIZE", "256"))
+
+# Seconds the formatter keeps the names of author users, 0 to disable. Renamed users are deposited
+# with their cached name until it expires in every worker, so keep it short
+CROSSREF_USER_CACHE_TTL = int(env("CROSSREF_USER_CACHE_TTL", "0"))
+
+# Reserve publish sequence numbers for Crossref in blocks of this size per worker, 0 to disable
+CROSSREF_SEQUENCE_BLOCK_SIZE = int(env("CROSSREF_SEQUENCE_BLOCK_SIZE", "0"))
+
+# Store the Crossref documents of the publish queue compressed, see ``tga.publish.compression``.
+# Off by default, compressed documents can not be read in the publish queue UI and the legal archive
+CROSSREF_COMPRESS_PAYLOADS = strtobool(env("CROSSREF_COMPRESS_PAYLOADS", "false"))
+CROSSREF_COMPRESSION_LEVEL = int(env("CROSSREF_COMPRESSION_LEVEL", "6"))
+
+# Warm up connections, the replace words macro and the Crossref formatter when gunicorn and Celery workers start
+WORKER_WARMUP_ENABLED = strtobool(env("WORKER_WARMUP_ENABLED", "true"))
+# Preload the users of the most frequent authors of the last ``WORKER_WARMUP_AUTHORS_DAYS`` days,
+# only with ``CROSSREF_USER_CACHE_TTL`` set
+WORKER_WARMUP_AUTHORS = int(env("WORKER_WARMUP_AUTHORS", "100"))
+WORKER_WARMUP_AUTHORS_DAYS = int(env("WORKER_WARMUP_AUTHORS_DAYS", "90"))
+
+# DOI resolver of the content API, see ``tga.doi_resolver``
+DOI_RESOLVER_CHANNEL = env("DOI_RESOLVER_CHANNEL", "tga:doi_resolver")
+# Seconds between full reloads of the DOI index in every content API process, the index is reloaded
+# on Redis reconnects already, this only picks up DOIs which failed to be published to Redis
+DOI_RESOLVER_RELOAD_INTERVAL = int(env("DOI_RESOLVER_RELOAD_INTERVAL", "86400"))
+DOI_RESOLVER_MAX_AGE = int(env("DOI_RESOLVER_MAX_AGE", "300"))
+# Item URL returned by the resolver, with ``{id}`` and ``{doi}`` placeholders, defaults to the content API item
+DOI_RESOLVER_URL_TEMPLATE = env("DOI_RESOLVER_URL_TEMPLATE", "")
+
+# Profiling of the Elastic queries made by the tga code, see ``tga.elastic_profiling``
+ELASTIC_PROFILING_ENABLED = strtobool(env("ELASTIC_PROFILING_ENABLED", "false"))
+ELASTIC_PROFILING_ES_PROFILE = strtobool(env("ELASTIC_PROFILING_ES_PROFILE", "false"))
+ELASTIC_PROFILING_SLOW_MS = int(env("ELASTIC_PROFILING_SLOW_MS", "500"))
+ELASTIC_PROFILING_SUMMARY_EVERY = int(env("ELASTIC_PROFILING_SUMMARY_EVERY", "100"))
+
 APM_SERVICE_NAME = "360info"
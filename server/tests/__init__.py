@@ -0,0 +1,7 @@
+import os
+
+# the fast setup patches ``superdesk.tests``, only load it when used
+if os.environ.get("TGA_FAST_TESTS") or os.environ.get("TGA_TESTS_DB_SUFFIX"):
+    from tests import fast_setup
+
+    fast_setup.install()
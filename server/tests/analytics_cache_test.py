@@ -0,0 +1,98 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from flask import Flask
+
+from tga.analytics_cache import make_key, get_data_window, get_or_compute, cached_generate_report, REPORT_KEY
+
+
+class MemoryRedis:
+    def __init__(self):
+        self.data = {}
+        self.lock = Lock()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value.encode() if isinstance(value, str) else value
+            return True
+
+    def exists(self, key):
+        return key in self.data
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class ReportService:
+    def __init__(self, lt, gte):
+        self.dates = (lt, gte, "+1000")
+
+    def _es_get_date_filters(self, params):
+        return self.dates
+
+
+class AnalyticsCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["DEFAULT_TIMEZONE"] = "Australia/Melbourne"
+        self.app.redis = MemoryRedis()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def test_key_normalizes_params(self):
+        self.assertEqual(
+            make_key(REPORT_KEY, {"dates": {"filter": "yesterday"}, "desks": [], "chart": {"title": None}}),
+            make_key(REPORT_KEY, {"chart": {}, "dates": {"filter": "yesterday"}}),
+        )
+        self.assertNotEqual(
+            make_key(REPORT_KEY, {"dates": {"filter": "yesterday"}}),
+            make_key(REPORT_KEY, {"dates": {"filter": "last_week"}}),
+        )
+
+    def test_data_window(self):
+        yesterday = get_data_window(ReportService("now/d", "now-1d/d"), {})
+        self.assertEqual(len(yesterday["bucket"]), len("2022-05-31"))
+
+        past_range = get_data_window(ReportService("2022-05-31T23:59:59+1000", "2022-05-01T00:00:00+1000"), {})
+        self.assertIsNone(past_range["bucket"])
+
+        until_now = get_data_window(ReportService("now", "now-2h/h"), {})
+        self.assertIsInstance(until_now["bucket"], int)
+
+    def test_concurrent_renders_deduplicated(self):
+        calls = []
+
+        def render(options, mimetype=None, width=None):
+            calls.append(options)
+            time.sleep(0.5)
+            return b"image"
+
+        generate_report = cached_generate_report(render)
+
+        def run(_index):
+            with self.app.app_context():
+                return generate_report({"series": [1, 2]}, mimetype="image/png", width=800)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(run, range(4)))
+
+        self.assertEqual(results, [b"image"] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(generate_report({"series": [1, 2]}, mimetype="image/png", width=800), b"image")
+        self.assertEqual(len(calls), 1)
+
+    def test_html_report_cached_as_str(self):
+        value = get_or_compute("key", lambda: "<div/>", str.encode, bytes.decode)
+        self.assertEqual(value, "<div/>")
+        self.assertEqual(cached_generate_report(lambda options: "<table/>")({"rows": []}), "<table/>")
+        self.assertEqual(cached_generate_report(lambda options: "other")({"rows": []}), "<table/>")
@@ -0,0 +1,18 @@
+import unittest
+
+from tga.publish.compression import compress_payload, decompress_payload, is_compressed
+
+
+class CompressionTest(unittest.TestCase):
+    def test_round_trip(self):
+        payload = '<?xml version="1.0" encoding="UTF-8"?><doi_batch>Zürich ' + "<x/>" * 100 + "</doi_batch>"
+        compressed = compress_payload(payload)
+
+        self.assertTrue(is_compressed(compressed))
+        self.assertLess(len(compressed), len(payload))
+        self.assertEqual(decompress_payload(compressed), payload)
+
+    def test_uncompressed_values_unchanged(self):
+        self.assertEqual(decompress_payload("<doi_batch/>"), "<doi_batch/>")
+        self.assertFalse(is_compressed("<doi_batch/>"))
+        self.assertIsNone(decompress_payload(None))
@@ -1,9 +1,14 @@
+import io
+import zipfile
 from datetime import datetime
 from unittest.mock import patch
 from bson import ObjectId
+from lxml import etree
 
 from superdesk.tests import TestCase
 from tga.publish.formatters.crossref import CrossrefFormatter
+from tga.publish.compression import is_compressed, decompress_payload
+from tga.commands.export_crossref import get_export_items, render_documents, iter_zip, iter_doi_batch
 
 USER_1_ID = ObjectId()
 USER_2_ID = ObjectId()
@@ -108,3 +113,130 @@ class CrossrefFormatterTest(TestCase):
         self.assertIsNotNone(contributors.get("Perry_Doc"))
         self.assertEqual(contributors["Perry_Doc"].attrib["sequence"], "additional")
         self.assertEqual(contributors["Perry_Doc"].attrib["contributor_role"], "editor")
+
+    def _get_article(self, version=1):
+        return {
+            "_id": "urn:localhost.abc",
+            "guid": "urn:localhost.abc",
+            "type": "text",
+            "_current_version": version,
+            "extra": {"doi": "10.54377/f5f3-c543"},
+            "headline": "Headline version {}".format(version),
+            "versioncreated": datetime(2022, 5, 31, 11, 45, 19, 0),
+            "authors": [{"name": "Author", "parent": USER_1_ID, "role": "author"}],
+        }
+
+    @patch("tga.publish.formatters.crossref.utcnow", return_value=datetime(2022, 5, 31, 13, 0, 0))
+    @patch("tga.publish.formatters.crossref.ObjectId", return_value=doi_batch_id)
+    def test_cached_output_matches_uncached(self, _object_id, _utcnow):
+        CrossrefFormatter.output_cache.clear()
+        article = self._get_article()
+        uncached = self.formatter._serialize(self.formatter._gen_xml(article))
+
+        self.assertEqual(self.formatter._render(article), uncached)
+        self.assertEqual(len(CrossrefFormatter.output_cache.entries), 1)
+        self.assertEqual(self.formatter._render(article), uncached)
+
+    def test_cache_regenerates_head(self):
+        CrossrefFormatter.output_cache.clear()
+        article = self._get_article()
+
+        with patch("tga.publish.formatters.crossref.ObjectId", return_value="batch1"):
+            first = self.formatter._render(article)
+        with patch("tga.publish.formatters.crossref.ObjectId", return_value="batch2"):
+            second = self.formatter._render(article)
+
+        self.assertIn("<doi_batch_id>batch1</doi_batch_id>", first)
+        self.assertIn("<doi_batch_id>batch2</doi_batch_id>", second)
+        self.assertEqual(first.replace("batch1", "batch2"), second.replace(_timestamp(second), _timestamp(first)))
+
+    def test_cache_invalidated_on_new_version(self):
+        CrossrefFormatter.output_cache.clear()
+        self.formatter._render(self._get_article(version=1))
+        output = self.formatter._render(self._get_article(version=2))
+
+        self.assertIn("Headline version 2", output)
+        self.assertEqual(len(CrossrefFormatter.output_cache.entries), 1)
+
+    def test_user_cache(self):
+        CrossrefFormatter.user_cache.clear()
+        with patch.dict(self.app.config, {"CROSSREF_USER_CACHE_TTL": 300}):
+            self.formatter._get_contributors(self._get_article())
+            self.app.data.get_mongo_collection("users").update_one({"_id": USER_1_ID}, {"$set": {"first_name": "Jo"}})
+
+            self.assertEqual("Joe", self.formatter._get_contributors(self._get_article())[0][2])
+        with patch.dict(self.app.config, {"CROSSREF_USER_CACHE_TTL": 0}):
+            self.assertEqual("Jo", self.formatter._get_contributors(self._get_article())[0][2])
+
+    @patch("tga.publish.formatters.crossref.generate_sequence_number")
+    def test_export_without_sequence_number(self, generate_sequence_number):
+        output = self.formatter.export(self._get_article())
+
+        self.assertIn("<doi>10.54377/f5f3-c543</doi>", output)
+        generate_sequence_number.assert_not_called()
+
+    def _get_articles(self, count):
+        return [
+            dict(self._get_article(), _id="urn:localhost.{}".format(index), extra={"doi": "10.54377/{}".format(index)})
+            for index in range(count)
+        ]
+
+    def test_export_doi_batch(self):
+        output = b"".join(iter_doi_batch(render_documents(self._get_articles(5), workers=2)))
+
+        xml = etree.fromstring(output)
+        self.assertEqual(len(xml.findall("{*}head")), 1)
+        self.assertEqual(
+            [doi.text for doi in xml.iterfind("{*}body/{*}report-paper/{*}report-paper_metadata/{*}doi_data/{*}doi")],
+            ["10.54377/{}".format(index) for index in range(5)],
+        )
+
+    def test_export_doi_batch_of_unindented_documents(self):
+        documents = [
+            (article, etree.tostring(etree.fromstring(document.encode("utf-8")), encoding="unicode"))
+            for article, document in render_documents(self._get_articles(2), workers=1)
+        ]
+        output = b"".join(iter_doi_batch(documents))
+
+        xml = etree.fromstring(output)
+        self.assertEqual(len(xml.findall("{*}body/{*}report-paper")), 2)
+
+    def test_export_items_in_id_order(self):
+        self.app.data.get_mongo_collection("archive").insert_many(self._get_articles(3))
+
+        items = get_export_items(["urn:localhost.2", "urn:localhost.0", "urn:localhost.1"])
+        self.assertEqual([item["_id"] for item in items], ["urn:localhost.2", "urn:localhost.0", "urn:localhost.1"])
+
+    def test_export_zip(self):
+        output = b"".join(iter_zip(render_documents(self._get_articles(3), workers=2)))
+
+        with zipfile.ZipFile(io.BytesIO(output)) as archive:
+            self.assertEqual(archive.namelist(), ["10.54377_0.xml", "10.54377_1.xml", "10.54377_2.xml"])
+            xml = etree.fromstring(archive.read("10.54377_1.xml"))
+        doi = xml.find("{*}body/{*}report-paper/{*}report-paper_metadata/{*}doi_data/{*}doi")
+        self.assertEqual(doi.text, "10.54377/1")
+
+    @patch("tga.publish.formatters.crossref.generate_sequence_number", return_value=10)
+    @patch("tga.publish.formatters.crossref.ObjectId", return_value=doi_batch_id)
+    def test_formatted_item_is_readable(self, _object_id, _generate_sequence_number):
+        sequence, formatted_doc = self.formatter.format(self._get_article(), {"_id": "sub"})[0]
+
+        self.assertEqual(sequence, 10)
+        self.assertFalse(is_compressed(formatted_doc))
+        self.assertIn("<doi_batch_id>{}</doi_batch_id>".format(doi_batch_id), formatted_doc)
+
+    @patch("tga.publish.formatters.crossref.generate_sequence_number", return_value=10)
+    @patch("tga.publish.formatters.crossref.ObjectId", return_value=doi_batch_id)
+    def test_compressed_payload(self, _object_id, _generate_sequence_number):
+        article = self._get_article()
+        with patch.dict(self.app.config, {"CROSSREF_COMPRESS_PAYLOADS": True}):
+            sequence, formatted_doc = self.formatter.format(article, {"_id": "sub"})[0]
+
+        self.assertEqual(sequence, 10)
+        self.assertTrue(is_compressed(formatted_doc))
+        self.assertEqual(decompress_payload(formatted_doc), self.formatter.format(article, {"_id": "sub"})[0][1])
+        self.assertLess(len(formatted_doc), len(decompress_payload(formatted_doc)))
+
+
+def _timestamp(output):
+    return output.split("<timestamp>")[1].split("</timestamp>")[0]
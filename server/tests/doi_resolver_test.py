@@ -0,0 +1,110 @@
+import unittest
+from unittest.mock import Mock
+
+from flask import Flask
+
+from tga.doi_resolver import api
+from tga.doi_resolver.index import DOIIndex, DOIIndexUpdater, encode_update, decode_update
+
+
+class ItemsCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection):
+        return iter(self.docs)
+
+
+class PubSub:
+    def __init__(self, messages, on_empty):
+        self.messages = messages
+        self.on_empty = on_empty
+
+    def subscribe(self, channel):
+        pass
+
+    def get_message(self, timeout):
+        if not self.messages:
+            self.on_empty()
+            return None
+        return {"type": "message", "data": self.messages.pop(0)}
+
+    def close(self):
+        pass
+
+
+class DOIIndexTest(unittest.TestCase):
+    def test_load_latest_item_wins(self):
+        index = DOIIndex()
+        count = index.load(
+            ItemsCollection(
+                [
+                    {"_id": "rewrite", "extra": {"doi": "10.1/a"}, "versioncreated": 2},
+                    {"_id": "original", "extra": {"doi": "10.1/a"}, "versioncreated": 1},
+                    {"_id": "other", "extra": {"doi": "10.1/b"}, "versioncreated": 1},
+                ]
+            )
+        )
+
+        self.assertEqual(count, 2)
+        self.assertEqual(index.get("10.1/a"), "rewrite")
+        self.assertEqual(index.get("10.1/b"), "other")
+        self.assertIsNone(index.get("10.1/c"))
+
+    def test_published_dois_kept_on_reload(self):
+        index = DOIIndex()
+        index.set(*decode_update(encode_update("10.1/new", "new")))
+        index.load(ItemsCollection([]))
+        self.assertEqual(index.get("10.1/new"), "new")
+
+        index.load(ItemsCollection([{"_id": "new", "extra": {"doi": "10.1/new"}, "versioncreated": 1}]))
+        self.assertEqual(index.pending, {})
+        self.assertEqual(index.get("10.1/new"), "new")
+
+    def test_updater_loads_on_subscribe(self):
+        index = DOIIndex()
+        collection = ItemsCollection([{"_id": "old", "extra": {"doi": "10.1/old"}, "versioncreated": 1}])
+        messages = [encode_update("10.1/new", "new")]
+        updater = DOIIndexUpdater(index, collection, None, "dois", reload_interval=0)
+        updater.redis = Mock(pubsub=lambda **kwargs: PubSub(messages, updater.stop))
+
+        updater.listen()
+        self.assertTrue(index.loaded.is_set())
+        self.assertEqual(index.get("10.1/old"), "old")
+        self.assertEqual(index.get("10.1/new"), "new")
+
+        # reloaded on reconnect
+        collection.docs.append({"_id": "missed", "extra": {"doi": "10.1/missed"}, "versioncreated": 1})
+        updater.stopped.clear()
+        updater.listen()
+        self.assertEqual(index.get("10.1/missed"), "missed")
+        self.assertEqual(index.get("10.1/new"), "new")
+
+
+class DOIResolverEndpointTest(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        app.config["CONTENTAPI_URL"] = "http://capi/api"
+        app.register_blueprint(api.bp, url_prefix="/api")
+        self.client = app.test_client()
+        api.index.set("10.54377/f5f3-c543", "urn:localhost:abc")
+
+    def test_resolve(self):
+        response = self.client.get("/api/doi/10.54377/f5f3-c543")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.get_json(),
+            {
+                "doi": "10.54377/f5f3-c543",
+                "item_id": "urn:localhost:abc",
+                "url": "http://capi/api/items/urn:localhost:abc",
+            },
+        )
+        self.assertIn("max-age=300", response.headers["Cache-Control"])
+
+        etag = response.headers["ETag"]
+        response = self.client.get("/api/doi?doi=10.54377/f5f3-c543", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_unknown_doi(self):
+        self.assertEqual(self.client.get("/api/doi/10.54377/unknown").status_code, 404)
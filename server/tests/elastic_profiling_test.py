@@ -0,0 +1,27 @@
+import unittest
+
+from tga.elastic_profiling import ElasticProfiler, _format_profile
+
+
+class ElasticProfilerTest(unittest.TestCase):
+    def test_summary_per_callsite(self):
+        profiler = ElasticProfiler(max_samples=3)
+        for took in [10, 20, 30, 40]:
+            profiler.record("published", took, took + 5.0)
+        profiler.record("archive", None, 1.0)
+
+        summary = profiler.summary()
+        self.assertEqual(summary["published"]["queries"], 4)
+        # only the latest samples are kept
+        self.assertEqual(summary["published"]["took"]["count"], 3)
+        self.assertEqual(summary["published"]["took"]["p50"], 30)
+        self.assertEqual(summary["published"]["wall"]["max"], 45.0)
+        self.assertEqual(summary["archive"]["took"]["count"], 0)
+
+    def test_format_profile(self):
+        profile = {
+            "shards": [
+                {"id": "[node][published][0]", "searches": [{"query": [{"time_in_nanos": 1500000}]}]},
+            ]
+        }
+        self.assertEqual(_format_profile(profile), "[node][published][0]:1.5ms")
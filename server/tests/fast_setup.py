@@ -0,0 +1,364 @@
+"""Fast setup of the behave and nose tests
+
+Superdesk rebuilds the app for every behave scenario and drops and re-creates all the Mongo
+databases and Elastic indexes before every scenario and unit test. With ``TGA_FAST_TESTS=1``:
+
+* behave scenarios reuse the app built by the first one, only scenarios with their own config
+  (``@notesting``) get a new app, and the app config and media storage changed by the steps
+  are restored before the next scenario,
+* the databases are cleaned and the indexes created once per app, then the state after the
+  initial setup is restored by dropping only the Mongo collections changed since (by
+  ``dbHash``) and deleting the documents of the changed indexes behind the resource aliases.
+
+``TGA_TESTS_DB_SUFFIX`` is appended to the test database and index names, so several test
+processes can use the same Mongo and Elastic. The time spent in setup is printed at the end
+of a behave run, and written as JSON to ``TGA_TESTS_SETUP_REPORT`` when set.
+
+To run the feature files in parallel processes, each with its own databases (from the
+``server`` directory)::
+
+    python -m tests.fast_setup --processes 4
+    python -m tests.fast_setup --processes 2 features/crossref.feature features/slack.feature -- --stop
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from elasticsearch.exceptions import NotFoundError
+from superdesk import tests
+from superdesk.default_settings import strtobool
+from superdesk.tests import environment
+
+FAST_ENV = "TGA_FAST_TESTS"
+DB_SUFFIX_ENV = "TGA_TESTS_DB_SUFFIX"
+REPORT_ENV = "TGA_TESTS_SETUP_REPORT"
+
+#: Test mongo databases by their config prefix, same as ``superdesk.tests.drop_mongo``
+MONGO_DBS = (
+    ("MONGO", "MONGO_DBNAME"),
+    ("ARCHIVED", "ARCHIVED_DBNAME"),
+    ("LEGAL_ARCHIVE", "LEGAL_ARCHIVE_DBNAME"),
+    ("CONTENTAPI_MONGO", "CONTENTAPI_MONGO_DBNAME"),
+)
+
+
+def is_enabled():
+    return bool(strtobool(os.environ.get(FAST_ENV) or "false"))
+
+
+def get_db_config(conf, suffix):
+    """Return the test database and index names of ``conf`` with ``suffix`` appended"""
+
+    updates = {}
+    for prefix, name in MONGO_DBS:
+        if conf.get(name):
+            updates[name] = conf[name] + suffix
+            updates[prefix + "_URI"] = conf[prefix + "_URI"].rsplit("/", 1)[0] + "/" + updates[name]
+    for name in ("ELASTICSEARCH_INDEX", "CONTENTAPI_ELASTICSEARCH_INDEX"):
+        if conf.get(name):
+            updates[name] = conf[name] + suffix
+    if conf.get("ELASTICSEARCH_INDEXES"):
+        updates["ELASTICSEARCH_INDEXES"] = {
+            resource: index + suffix for resource, index in conf["ELASTICSEARCH_INDEXES"].items()
+        }
+    return updates
+
+
+class FastReset:
+    """Replacement of ``superdesk.tests.clean_dbs`` restoring the state after the first clean of the app"""
+
+    def __init__(self, clean_dbs):
+        self.clean_dbs = clean_dbs
+        self.app = None
+        self.mongo = None
+        self.elastic = None
+        self.config = None
+        self.media = None
+        self.snapshot_pending = False
+        self.skip_init_index = False
+        self.full_resets = 0
+        self.fast_resets = 0
+
+    def __call__(self, app, force=False):
+        if app is self.app and not self.snapshot_pending:
+            with app.app_context():
+                if self.restore(app):
+                    self.fast_resets += 1
+                    # the indexes are already there, ``superdesk.tests.setup`` calls ``init_index`` next
+                    self.skip_init_index = True
+                    return
+
+        self.clean_dbs(app, force)
+        self.full_resets += 1
+        self.app = app
+        self.snapshot_pending = True
+        self.wrap_init_index(app)
+
+    def wrap_init_index(self, app):
+        elastic = app.data.elastic
+        if getattr(elastic.init_index, "fast_reset", None) is self:
+            return
+        init_index = elastic.init_index
+
+        def fast_init_index(*args, **kwargs):
+            if self.skip_init_index:
+                self.skip_init_index = False
+                return
+            init_index(*args, **kwargs)
+            if self.snapshot_pending:
+                self.snapshot(self.app)
+
+        fast_init_index.fast_reset = self
+        elastic.init_index = fast_init_index
+
+    def snapshot(self, app):
+        self.mongo = {dbname: self.get_mongo_hashes(db) for dbname, db in self.get_mongo_dbs(app)}
+        self.elastic = {key: (es, self.get_index_counts(es, aliases)) for key, (es, aliases) in self.get_elastic(app)}
+        self.config = dict(app.config)
+        self.media = app.media
+        self.snapshot_pending = False
+
+    def restore(self, app):
+        """Restore the snapshot, return ``False`` when it needs a full clean instead"""
+
+        for dbname, db in self.get_mongo_dbs(app):
+            snapshot = self.mongo.get(dbname, {})
+            hashes = self.get_mongo_hashes(db)
+            if any(hashes.get(collection) != md5 for collection, md5 in snapshot.items()):
+                return False
+            for collection in hashes:
+                if collection not in snapshot:
+                    db.drop_collection(collection)
+
+        for key, (es, aliases) in self.get_elastic(app):
+            snapshot = self.elastic.get(key, (None, {}))[1]
+            try:
+                counts = self.get_index_counts(es, aliases)
+            except NotFoundError:
+                return False
+            changed = [index for index in counts if counts[index] != snapshot.get(index)]
+            if counts.keys() != snapshot.keys() or any(snapshot[index] for index in changed):
+                # an index was re-created or documents of the snapshot were changed
+                return False
+            if changed:
+                es.delete_by_query(
+                    index=",".join(changed), body={"query": {"match_all": {}}}, refresh=True, conflicts="proceed"
+                )
+
+        for key in set(app.config) - set(self.config):
+            del app.config[key]
+        app.config.update(self.config)
+        app.media = self.media
+        return True
+
+    def get_mongo_dbs(self, app):
+        for prefix, name in MONGO_DBS:
+            if app.config.get(name):
+                yield app.config[name], app.data.mongo.pymongo(prefix=prefix).cx[app.config[name]]
+
+    def get_mongo_hashes(self, db):
+        return db.command("dbHash")["collections"]
+
+    def get_elastic(self, app):
+        """Return ``(key, (client, aliases))`` of the resource indexes, grouped by elastic client"""
+
+        elastic = app.data.elastic
+        clients = {}
+        for resource in elastic._get_elastic_resources():
+            es = elastic.elastic(resource)
+            clients.setdefault(id(es), (es, set()))[1].add(elastic._resource_index(resource))
+        return sorted(clients.items(), key=lambda client: client[0])
+
+    def get_index_counts(self, es, aliases):
+        """Return the document count of the concrete indexes behind ``aliases``"""
+
+        index = ",".join(sorted(aliases))
+        es.indices.refresh(index=index)
+        stats = es.indices.stats(index=index, metric="docs")["indices"]
+        return {name: data["primaries"]["docs"]["count"] for name, data in stats.items()}
+
+
+class SetupTimer:
+    """Time spent in the setup of behave scenarios"""
+
+    def __init__(self):
+        self.scenarios = 0
+        self.total = 0.0
+        self.full_setups = []
+
+    @contextmanager
+    def measure(self, scenario=False):
+        app = getattr(tests.setup, "app", None)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.total += duration
+            if scenario:
+                self.scenarios += 1
+                if getattr(tests.setup, "app", None) is not app:
+                    self.full_setups.append(duration)
+
+    def get_report(self):
+        full_setup = sum(self.full_setups) / len(self.full_setups) if self.full_setups else 0
+        return {
+            "scenarios": self.scenarios,
+            "setup_time": self.total,
+            "full_setups": len(self.full_setups),
+            "full_setup_time": full_setup,
+            "saved_time": max(0.0, self.scenarios * full_setup - self.total),
+        }
+
+    def report(self):
+        report = self.get_report()
+        if os.environ.get(REPORT_ENV):
+            with open(os.environ[REPORT_ENV], "w") as report_file:
+                json.dump(report, report_file)
+        print(format_report(report))
+
+
+def format_report(report):
+    return "Setup: {} scenarios in {:.1f}s ({:.2f}s per scenario), {} full setups of {:.2f}s, {:.1f}s saved".format(
+        report["scenarios"],
+        report["setup_time"],
+        report["setup_time"] / report["scenarios"] if report["scenarios"] else 0,
+        report["full_setups"],
+        report["full_setup_time"],
+        report["saved_time"],
+    )
+
+
+timer = SetupTimer()
+
+#: App reused by the scenarios, built by the first one
+_scenario_app = None
+
+
+def install():
+    """Patch ``superdesk.tests`` for database suffixes and, with ``TGA_FAST_TESTS``, the fast reset"""
+
+    suffix = os.environ.get(DB_SUFFIX_ENV)
+    if suffix and not getattr(tests.update_config, "db_suffix", None):
+        update_config = tests.update_config
+
+        def update_config_with_suffix(conf):
+            conf = update_config(conf)
+            conf.update(get_db_config(conf, suffix))
+            return conf
+
+        update_config_with_suffix.db_suffix = suffix
+        tests.update_config = update_config_with_suffix
+
+    if is_enabled() and not isinstance(tests.clean_dbs, FastReset):
+        tests.clean_dbs = FastReset(tests.clean_dbs)
+
+
+def before_feature(context, feature):
+    """``before_feature`` of superdesk without building the app, the scenarios set it up"""
+
+    os.environ["BEHAVE_TESTING"] = "1"
+    if (
+        "tobefixed" in feature.tags
+        or ("dbauth" in feature.tags and environment.LDAP_SERVER)
+        or ("ldapauth" in feature.tags and not environment.LDAP_SERVER)
+    ):
+        feature.mark_skipped()
+
+
+def setup_before_scenario(context, scenario, config, app_factory):
+    """``setup_before_scenario`` of superdesk reusing the app of the previous scenarios"""
+
+    global _scenario_app
+
+    own_config = "notesting" in scenario.tags
+    reuse = not own_config and _scenario_app is not None and getattr(tests.setup, "app", None) is _scenario_app
+    environment.setup_before_scenario(context, scenario, {} if reuse else config, app_factory=app_factory)
+    if not own_config:
+        _scenario_app = tests.setup.app
+        tests.setup.reset = False
+
+
+def count_scenarios(path):
+    with open(path, encoding="utf-8") as feature_file:
+        return sum(1 for line in feature_file if line.lstrip().startswith(("Scenario", "Example:")))
+
+
+def split_features(paths, processes):
+    """Split the feature files in ``processes`` groups with about the same number of scenarios"""
+
+    files = []
+    for path in paths:
+        path = Path(path)
+        files.extend(sorted(path.glob("**/*.feature")) if path.is_dir() else [path])
+
+    groups = [[0, []] for _i in range(processes)]
+    for path in sorted(files, key=lambda path: count_scenarios(path), reverse=True):
+        group = min(groups, key=lambda group: group[0])
+        group[0] += max(1, count_scenarios(path))
+        group[1].append(str(path))
+    return [group[1] for group in groups if group[1]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", "-p", type=int, default=os.cpu_count())
+    parser.add_argument("paths", nargs="*", default=["features"], help="feature files or directories")
+    argv = sys.argv[1:]
+    separator = argv.index("--") if "--" in argv else len(argv)
+    args = parser.parse_args(argv[:separator])
+    behave_args = argv[separator:][1:]
+
+    groups = split_features(args.paths, args.processes)
+    if not groups:
+        parser.error("no feature files found")
+
+    start = time.time()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        processes = []
+        for number, files in enumerate(groups):
+            env = dict(os.environ)
+            env.update(
+                {
+                    FAST_ENV: "1",
+                    DB_SUFFIX_ENV: "_{}".format(number),
+                    REPORT_ENV: os.path.join(tmp_dir, "report_{}.json".format(number)),
+                }
+            )
+            output = open(os.path.join(tmp_dir, "output_{}.log".format(number)), "w+")
+            process = subprocess.Popen(
+                [sys.executable, "-m", "behave"] + behave_args + files, env=env, stdout=output, stderr=subprocess.STDOUT
+            )
+            processes.append((number, files, process, output))
+
+        returncode = 0
+        reports = []
+        for number, files, process, output in processes:
+            process.wait()
+            returncode = returncode or process.returncode
+            output.seek(0)
+            print("=== process {}: {} feature files, exit code {}".format(number, len(files), process.returncode))
+            sys.stdout.write(output.read())
+            output.close()
+            report_path = os.path.join(tmp_dir, "report_{}.json".format(number))
+            if os.path.exists(report_path):
+                with open(report_path) as report_file:
+                    reports.append(json.load(report_file))
+
+    if reports:
+        total = {key: sum(report[key] for report in reports) for key in reports[0]}
+        total["full_setup_time"] = max(report["full_setup_time"] for report in reports)
+        print(format_report(total))
+    print("{} processes finished in {:.1f}s".format(len(groups), time.time() - start))
+    sys.exit(returncode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from tests.fast_setup import FastReset, get_db_config, split_features
+
+
+class GetDBConfigTestCase(unittest.TestCase):
+    def test_suffix(self):
+        conf = {
+            "MONGO_DBNAME": "sptests",
+            "MONGO_URI": "mongodb://mongo:27017/sptests",
+            "LEGAL_ARCHIVE_DBNAME": "sptests_legal_archive",
+            "LEGAL_ARCHIVE_URI": "mongodb://mongo:27017/sptests_legal_archive",
+            "ELASTICSEARCH_INDEX": "sptest",
+            "ELASTICSEARCH_INDEXES": {"archive": "sptest_archive"},
+        }
+        updates = get_db_config(conf, "_1")
+        self.assertEqual("sptests_1", updates["MONGO_DBNAME"])
+        self.assertEqual("mongodb://mongo:27017/sptests_1", updates["MONGO_URI"])
+        self.assertEqual("mongodb://mongo:27017/sptests_legal_archive_1", updates["LEGAL_ARCHIVE_URI"])
+        self.assertEqual("sptest_1", updates["ELASTICSEARCH_INDEX"])
+        self.assertEqual({"archive": "sptest_archive_1"}, updates["ELASTICSEARCH_INDEXES"])
+        self.assertNotIn("ARCHIVED_DBNAME", updates)
+
+
+class SplitFeaturesTestCase(unittest.TestCase):
+    def test_balance_scenarios(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name, scenarios in (("a", 4), ("b", 3), ("c", 1), ("d", 0)):
+                with open(os.path.join(tmp_dir, name + ".feature"), "w") as feature_file:
+                    feature_file.write("Feature: {}\n".format(name))
+                    feature_file.write("    Scenario: test\n" * scenarios)
+
+            groups = split_features([tmp_dir], 2)
+            self.assertEqual(
+                [["a.feature", "d.feature"], ["b.feature", "c.feature"]],
+                [sorted(os.path.basename(path) for path in group) for group in groups],
+            )
+            self.assertEqual(1, len(split_features([tmp_dir], 1)))
+
+
+class Elastic:
+    def __init__(self, counts):
+        self.counts = counts
+        self.deleted = []
+        self.indices = self
+
+    def refresh(self, index):
+        pass
+
+    def stats(self, index, metric):
+        return {"indices": {name: {"primaries": {"docs": {"count": count}}} for name, count in self.counts.items()}}
+
+    def delete_by_query(self, index, **kwargs):
+        self.deleted.extend(index.split(","))
+        for name in index.split(","):
+            self.counts[name] = 0
+
+
+class FastResetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cleaned = []
+        self.reset = FastReset(lambda app, force: self.cleaned.append(app))
+        self.reset.mongo = {"sptests": {}}
+        self.reset.config = {"A": 1}
+        self.reset.media = "media"
+        self.hashes = {}
+        self.dropped = []
+        self.es = Elastic({"sptest_archive_1": 0, "sptest_users_1": 0})
+        self.reset.elastic = {1: (self.es, {"sptest_archive_1": 0, "sptest_users_1": 0})}
+        self.reset.get_mongo_hashes = lambda db: self.hashes
+        self.reset.get_elastic = lambda app: [(1, (self.es, {"archive", "users"}))]
+
+    def restore(self, app):
+        db = Mock()
+        db.drop_collection.side_effect = self.dropped.append
+        self.reset.get_mongo_dbs = lambda app: [("sptests", db)]
+        return self.reset.restore(app)
+
+    def test_restore_touched(self):
+        app = Mock(config={"A": 2, "B": 3}, media="other")
+        self.hashes = {"archive": "abc", "users": "def"}
+        self.es.counts["sptest_users_1"] = 2
+
+        self.assertTrue(self.restore(app))
+        self.assertEqual(["archive", "users"], sorted(self.dropped))
+        self.assertEqual(["sptest_users_1"], self.es.deleted)
+        self.assertEqual({"A": 1}, app.config)
+        self.assertEqual("media", app.media)
+
+    def test_full_clean_when_index_recreated(self):
+        app = Mock(config={})
+        self.es.counts = {"sptest_archive_2": 0, "sptest_users_1": 0}
+        self.assertFalse(self.restore(app))
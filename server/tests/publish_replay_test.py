@@ -0,0 +1,84 @@
+import re
+import time
+from datetime import datetime
+from bson import ObjectId
+
+from superdesk.tests import TestCase
+from tga.publish.formatters.crossref import PUBLIC_DOI_URL_PREFIX, CrossrefFormatter
+from tga.publish.replay import Anonymizer, CrossrefStub, get_record_values, replay_event
+
+USER_ID = ObjectId()
+
+
+class AnonymizerTest(TestCase):
+    def setUp(self):
+        self.anonymizer = Anonymizer("salt")
+        self.user = {"_id": USER_ID, "first_name": "Joe", "last_name": "O'Blogs", "display_name": "Joe O'Blogs"}
+        self.item = {
+            "_id": "urn:localhost.abc",
+            "guid": "urn:localhost.abc",
+            "type": "text",
+            "_current_version": 3,
+            "extra": {"doi": "10.54377/f5f3-c543", "internal": "note"},
+            "headline": "Water &amp; <b>Climate</b> 2022",
+            "body_html": "<p>Secret body</p>",
+            "versioncreated": datetime(2022, 5, 31, 11, 45, 19),
+            "authors": [{"name": "Author", "parent": USER_ID, "role": "author", "sub_label": "Joe Blogs"}],
+            "original_creator": "someone",
+        }
+
+    def test_text_keeps_markup_case_and_length(self):
+        text = self.anonymizer.text(self.item["headline"])
+        self.assertRegex(text, r"^[A-Z][a-z]{4} &amp; <b>[A-Z][a-z]{6}</b> \d{4}$")
+        self.assertNotIn("Water", text)
+        self.assertEqual(text, Anonymizer("salt").text(self.item["headline"]))
+        self.assertNotEqual(text, Anonymizer("other").text(self.item["headline"]))
+
+    def test_item(self):
+        item = self.anonymizer.item(self.item)
+        self.assertEqual(item["_id"], item["guid"])
+        self.assertNotIn("localhost", item["_id"])
+        self.assertRegex(item["extra"]["doi"], r"^10\.54377/[0-9a-f]{4}-[0-9a-f]{4}$")
+        self.assertNotEqual(self.item["extra"]["doi"], item["extra"]["doi"])
+        self.assertEqual(self.anonymizer.user(self.user)["_id"], item["authors"][0]["parent"])
+        self.assertNotIn("sub_label", item["authors"][0])
+        self.assertNotIn("original_creator", item)
+        self.assertEqual(self.item["versioncreated"], item["versioncreated"])
+
+    def test_output_matches_anonymized_item(self):
+        self.app.data.insert("users", [self.user, self.anonymizer.user(self.user)])
+        formatter = CrossrefFormatter()
+        output = self.anonymizer.output(formatter.format_document(self.item))
+        self.assertNotIn("Blogs", output)
+        self.assertNotIn("Climate", output)
+
+        rendered = formatter.format_document(self.anonymizer.item(self.item))
+        self.assertEqual(get_record_values(output), get_record_values(rendered))
+
+    def test_output_hides_doi_and_url(self):
+        self.app.data.insert("users", [self.user])
+        document = CrossrefFormatter().format_document(self.item)
+        batch_id = re.search(r"<doi_batch_id>([^<]+)</doi_batch_id>", document).group(1)
+        output = self.anonymizer.output(document)
+
+        self.assertNotIn(self.item["extra"]["doi"], output)
+        self.assertNotIn(PUBLIC_DOI_URL_PREFIX + self.item["extra"]["doi"], output)
+        self.assertNotIn(batch_id, output)
+        self.assertIn(PUBLIC_DOI_URL_PREFIX + self.anonymizer.doi(self.item["extra"]["doi"]), output)
+
+    def test_replay_event(self):
+        self.app.data.insert("users", [self.anonymizer.user(self.user)])
+        item = self.anonymizer.item(self.item)
+        item["extra"].pop("doi")
+
+        stub = CrossrefStub().start()
+        try:
+            result = replay_event({"action": "publish", "item": item}, stub.url, time.time())
+        finally:
+            stub.stop()
+
+        self.assertIsNone(result["error"])
+        self.assertEqual(1, stub.uploads)
+        self.assertIn("item:publish:generate_doi", result["receivers"])
+        for stage in ("queue", "item_publish", "format", "transmit", "end_to_end"):
+            self.assertGreaterEqual(result["stages"][stage], 0)
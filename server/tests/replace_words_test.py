@@ -0,0 +1,73 @@
+import unittest
+
+from superdesk.tests import TestCase
+from macros.replace_words import compile_words, get_compiled_words, replace_in_item
+from tga.commands.replace_words import ReplaceWordsCommand, _init_worker, _replace_in_items
+
+WORDS = [
+    {"existing": "organisation", "replacement": "organization"},
+    {"existing": "colour", "replacement": "color"},
+]
+
+
+class ReplaceWordsTest(unittest.TestCase):
+    def test_replace_in_item(self):
+        item = {
+            "headline": "Organisation COLOUR",
+            "body_html": "<p>the organisation and its Colour</p>",
+            "slugline": "unchanged",
+        }
+
+        updates, diff = replace_in_item(item, compile_words(WORDS))
+
+        self.assertEqual(
+            updates,
+            {
+                "headline": "Organization COLOR",
+                "body_html": "<p>the organization and its Color</p>",
+            },
+        )
+        self.assertEqual(
+            diff,
+            {
+                "Organisation": "Organization",
+                "organisation": "organization",
+                "COLOUR": "COLOR",
+                "Colour": "Color",
+            },
+        )
+
+    def test_replace_in_items_returns_changed_only(self):
+        _init_worker(WORDS)
+        changed = _replace_in_items(
+            [
+                {"_id": "1", "headline": "colour"},
+                {"_id": "2", "headline": "nothing to do"},
+            ]
+        )
+
+        self.assertEqual([(item["_id"], updates) for item, updates, _diff in changed], [("1", {"headline": "color"})])
+
+    def test_compiled_words_reused_until_vocabulary_changes(self):
+        compiled = get_compiled_words(WORDS)
+
+        self.assertIs(compiled, get_compiled_words([dict(word) for word in WORDS]))
+        self.assertIsNot(compiled, get_compiled_words(WORDS[:1]))
+
+
+class ReplaceWordsSaveTest(TestCase):
+    def test_save_bumps_version(self):
+        self.app.data.insert("archive", [{"_id": "1", "type": "text", "headline": "colour", "_current_version": 1}])
+        collection = self.app.data.get_mongo_collection("archive")
+        item = collection.find_one({"_id": "1"})
+        stats = {"saved": 0, "conflicts": 0}
+
+        ReplaceWordsCommand().save([(item, {"headline": "color"}, {"colour": "color"})], stats)
+
+        saved = collection.find_one({"_id": "1"})
+        self.assertEqual(stats, {"saved": 1, "conflicts": 0})
+        self.assertEqual(saved["headline"], "color")
+        self.assertEqual(saved["_current_version"], 2)
+        self.assertNotEqual(saved["_etag"], item["_etag"])
+        versions = self.app.data.get_mongo_collection("archive_versions").find({"_id_document": "1"})
+        self.assertIn(2, [version["_current_version"] for version in versions])
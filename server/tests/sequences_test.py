@@ -0,0 +1,42 @@
+from superdesk.tests import TestCase
+from tga.publish.sequences import SequenceBlockAllocator
+
+
+class SequenceBlockAllocatorTest(TestCase):
+    def setUp(self):
+        self.collection = self.app.data.get_mongo_collection("sequences")
+        self.allocator = SequenceBlockAllocator(4, lambda: self.collection)
+
+    def get_sequence_number(self, key):
+        return self.collection.find_one({"key": key})["sequence_number"]
+
+    def test_reserves_blocks(self):
+        numbers = [self.allocator.next("subscribers_1)") for _i in range(6)]
+
+        self.assertEqual(numbers, [1, 2, 3, 4, 5, 6])
+        self.assertEqual(self.get_sequence_number("subscribers_1)"), 8)
+
+    def test_other_workers_get_their_own_block(self):
+        other = SequenceBlockAllocator(4, lambda: self.collection)
+
+        self.assertEqual(self.allocator.next("subscribers_1)"), 1)
+        self.assertEqual(other.next("subscribers_1)"), 5)
+        self.assertEqual(self.allocator.next("subscribers_1)"), 2)
+
+    def test_wraps_at_max(self):
+        numbers = [self.allocator.next("subscribers_1)", 1, 6) for _i in range(8)]
+
+        self.assertEqual(numbers, [1, 2, 3, 4, 5, 6, 1, 2])
+
+    def test_starts_at_min(self):
+        other = SequenceBlockAllocator(4, lambda: self.collection)
+        numbers = [allocator.next("subscribers_1)", 100, 1000) for allocator in [self.allocator, other] * 4]
+
+        self.assertEqual(sorted(numbers), list(range(100, 108)))
+
+    def test_wraps_at_max_above_min(self):
+        numbers = [self.allocator.next("subscribers_1)", 100, 105) for _i in range(14)]
+
+        self.assertEqual(numbers[:6], list(range(100, 106)))
+        self.assertEqual(numbers[6:12], list(range(100, 106)))
+        self.assertEqual(numbers[12:], [100, 101])
@@ -0,0 +1,78 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from tga.slack import SlackWebClient, SlackRateLimited, merge_messages
+
+
+class StubSlackHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append((self.path, self.headers.get("Authorization"), json.loads(body)))
+        status, headers, data = self.server.responses.pop(0)
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(data).encode("utf-8"))
+
+    def log_message(self, *args):
+        pass
+
+
+class SlackDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), StubSlackHandler)
+        self.server.requests = []
+        self.server.responses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = SlackWebClient("xoxb-test", "http://127.0.0.1:{}/api".format(self.server.server_port))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_post_message(self):
+        self.server.responses.append((200, {}, {"ok": True}))
+        self.assertTrue(self.client.post_message("C123", text="Assignment updated")["ok"])
+
+        path, auth, payload = self.server.requests[0]
+        self.assertEqual(path, "/api/chat.postMessage")
+        self.assertEqual(auth, "Bearer xoxb-test")
+        self.assertEqual(payload, {"channel": "C123", "text": "Assignment updated"})
+
+    def test_rate_limited_honours_retry_after(self):
+        self.server.responses.append((429, {"Retry-After": "12"}, {"ok": False, "error": "ratelimited"}))
+        with self.assertRaises(SlackRateLimited) as context:
+            self.client.post_message("C123", text="Assignment updated")
+        self.assertEqual(context.exception.retry_after, 12)
+
+    def test_merge_messages(self):
+        messages = [
+            {"channel": "C123", "as_user": False, "text": "first"},
+            {"channel": "C123", "as_user": False, "text": "second", "attachments": json.dumps([{"text": "a"}])},
+            {"channel": "C123", "as_user": False, "text": "x" * 20},
+        ]
+
+        merged = merge_messages(messages, max_length=20)
+        self.assertEqual(len(merged), 2)
+        self.assertEqual(merged[0]["text"], "first\nsecond")
+        self.assertEqual(json.loads(merged[0]["attachments"]), [{"text": "a"}])
+        self.assertFalse(merged[0]["as_user"])
+        self.assertEqual(merged[1]["text"], "x" * 20)
+        self.assertNotIn("attachments", merged[1])
+
+    def test_merge_messages_with_same_options_only(self):
+        messages = [
+            {"channel": "C123", "as_user": False, "text": "first"},
+            {"channel": "C123", "as_user": True, "text": "second"},
+            {"channel": "C123", "as_user": True, "text": "third"},
+            {"channel": "C123", "as_user": True, "link_names": 1, "text": "fourth"},
+        ]
+
+        merged = merge_messages(messages)
+        self.assertEqual([message["text"] for message in merged], ["first", "second\nthird", "fourth"])
+        self.assertEqual([message["as_user"] for message in merged], [False, True, True])
+        self.assertEqual(merged[2]["link_names"], 1)
@@ -0,0 +1,19 @@
+import unittest
+
+from tga.utils import percentile, summarize_latencies
+
+
+class UtilsTest(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([7], 90), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summarize_latencies(self):
+        summary = summarize_latencies([5.0, 1.0, 3.0])
+        self.assertEqual(summary["count"], 3)
+        self.assertEqual(summary["p50"], 3.0)
+        self.assertEqual(summary["max"], 5.0)
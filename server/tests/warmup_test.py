@@ -0,0 +1,53 @@
+from datetime import timedelta
+from unittest.mock import patch
+from bson import ObjectId
+
+from superdesk.tests import TestCase
+from superdesk.utc import utcnow
+from tga.publish.formatters.crossref import CrossrefFormatter
+from tga.warmup import warm_up
+
+USER_ID = ObjectId()
+OLD_USER_ID = ObjectId()
+
+
+class WarmUpTest(TestCase):
+    def setUp(self):
+        CrossrefFormatter.user_cache.clear()
+        self.app.data.insert(
+            "users",
+            [
+                {"_id": USER_ID, "username": "joe", "first_name": "Joe", "last_name": "Blogs"},
+                {"_id": OLD_USER_ID, "username": "ferry", "first_name": "Ferry", "last_name": "Blast"},
+            ],
+        )
+        self.app.data.get_mongo_collection("published").insert_many(
+            [
+                {"item_id": "recent", "versioncreated": utcnow(), "authors": [{"parent": USER_ID, "role": "author"}]},
+                {
+                    "item_id": "old",
+                    "versioncreated": utcnow() - timedelta(days=365),
+                    "authors": [{"parent": OLD_USER_ID, "role": "author"}],
+                },
+            ]
+        )
+
+    def test_warm_up(self):
+        with patch.dict(self.app.config, {"WORKER_WARMUP_ENABLED": True, "CROSSREF_USER_CACHE_TTL": 300}):
+            timings = warm_up(self.app)
+
+        self.assertEqual(["mongo", "elastic", "redis", "macros", "users", "crossref"], list(timings))
+        self.assertEqual({"first_name": "Joe", "last_name": "Blogs"}, CrossrefFormatter.user_cache.get(USER_ID, 300))
+        self.assertIsNone(CrossrefFormatter.user_cache.get(OLD_USER_ID, 300))
+
+    def test_users_not_loaded_without_cache_ttl(self):
+        with patch.dict(self.app.config, {"WORKER_WARMUP_ENABLED": True, "CROSSREF_USER_CACHE_TTL": 0}):
+            timings = warm_up(self.app)
+
+        self.assertIn("users", timings)
+        self.assertIsNone(CrossrefFormatter.user_cache.get(USER_ID, 300))
+
+    def test_disabled(self):
+        with patch.dict(self.app.config, {"WORKER_WARMUP_ENABLED": False}):
+            self.assertEqual({}, warm_up(self.app))
+        self.assertIsNone(CrossrefFormatter.user_cache.get(USER_ID, 300))
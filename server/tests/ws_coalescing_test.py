@@ -0,0 +1,71 @@
+import json
+import unittest
+
+from tga.ws_coalescing import NotificationCoalescer, merge_notifications
+
+
+def notification(event, **extra):
+    return json.dumps({"event": event, "extra": extra, "_created": "2022-06-01T10:00:00"})
+
+
+class NotificationCoalescerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduled = []
+        self.sent = []
+        self.coalescer = NotificationCoalescer(
+            {"item:publish": 1, "content:update": 1},
+            lambda delay, callback: self.scheduled.append((delay, callback)),
+            self.sent.append,
+        )
+
+    def test_other_events_are_not_buffered(self):
+        self.assertFalse(self.coalescer.add(notification("item:lock", item="a")))
+        self.assertEqual(self.scheduled, [])
+
+    def test_merge_within_window(self):
+        for item_id in ["a", "b", "c"]:
+            self.assertTrue(self.coalescer.add(notification("content:update", items={item_id: 1}, user="u1")))
+
+        self.assertEqual(len(self.scheduled), 1)
+        self.assertEqual(self.scheduled[0][0], 1.0)
+        self.scheduled[0][1]()
+
+        self.assertEqual(len(self.sent), 1)
+        message = json.loads(self.sent[0])
+        self.assertEqual(message["event"], "content:update")
+        self.assertEqual(message["extra"]["items"], {"a": 1, "b": 1, "c": 1})
+        self.assertEqual(message["extra"]["ids"], ["a", "b", "c"])
+        self.assertEqual(message["extra"]["coalesced"], 3)
+        self.assertEqual(message["extra"]["user"], "u1")
+
+        # next notification starts a new window
+        self.coalescer.add(notification("content:update", items={"d": 1}))
+        self.assertEqual(len(self.scheduled), 2)
+
+    def test_scalar_ids_are_not_lost(self):
+        self.coalescer.add(notification("item:publish", item="a", user="u1"))
+        self.coalescer.add(notification("item:publish", item="b", user="u1"))
+        self.coalescer.add(notification("item:publish", item="a", user="u1"))
+        self.scheduled[0][1]()
+
+        messages = [json.loads(message) for message in self.sent]
+        self.assertEqual([message["extra"]["item"] for message in messages], ["a", "b"])
+        self.assertEqual(messages[0]["extra"]["coalesced"], 2)
+        self.assertEqual(json.loads(notification("item:publish", item="b", user="u1")), messages[1])
+
+    def test_single_notification_is_sent_unchanged(self):
+        message = notification("item:publish", item="a")
+        self.coalescer.add(message)
+        self.scheduled[0][1]()
+        self.assertEqual(json.loads(self.sent[0]), json.loads(message))
+
+    def test_merge_items_dicts(self):
+        merged = merge_notifications(
+            [
+                {"event": "content:update", "extra": {"items": {"a": 1}, "desks": {"d1": 1}}},
+                {"event": "content:update", "extra": {"items": {"b": 1}, "desks": {"d2": 1}}},
+            ]
+        )
+        self.assertEqual(merged["extra"]["items"], {"a": 1, "b": 1})
+        self.assertEqual(merged["extra"]["desks"], {"d1": 1, "d2": 1})
+        self.assertEqual(merged["extra"]["ids"], ["a", "b"])
@@ -0,0 +1,210 @@
+"""Redis cache of scheduled analytics reports
+
+Scheduled reports run the report query in Elastic and render every chart with the Highcharts
+server, even when several schedules send the same report. When enabled, the email report
+service of analytics gets:
+
+* report results cached by report type, normalized params and data window,
+* rendered charts cached by their options and render settings,
+
+and concurrent identical computations (from any process) wait for the first one instead of
+running again.
+
+The data window is the resolved date filter of the report. Relative filters (``yesterday``,
+``last_week``, ...) are bucketed by the local date or hour they are rounded to, and filters ending
+``now`` by ``ANALYTICS_CACHE_NOW_WINDOW`` seconds, so a cached result is never used for another window.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime
+from uuid import uuid4
+
+from bson import json_util
+from flask import current_app as app
+
+from superdesk.utc import utc_to_local, utcnow
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "tga:analytics:"
+REPORT_KEY = KEY_PREFIX + "report:{}"
+CHART_KEY = KEY_PREFIX + "chart:{}"
+LOCK_KEY = KEY_PREFIX + "lock:{}"
+
+#: Date math rounding used by the analytics date filters and the bucket of the local time it depends on
+ROUNDING_BUCKETS = {
+    "/h": "%Y-%m-%dT%H",
+    "/d": "%Y-%m-%d",
+    "/w": "%Y-%m-%d",
+    "/M": "%Y-%m-%d",
+    "/y": "%Y-%m-%d",
+}
+
+
+def normalize(value):
+    """Drop empty values and sort dicts, so equivalent params give the same key"""
+
+    if isinstance(value, dict):
+        normalized = {key: normalize(item) for key, item in sorted(value.items())}
+        return {key: item for key, item in normalized.items() if item is not None and item not in ("", [], {})}
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    return value
+
+
+def make_key(template, *parts):
+    data = json.dumps(normalize(list(parts)), sort_keys=True, default=str)
+    return template.format(hashlib.sha256(data.encode("utf-8")).hexdigest())
+
+
+def get_data_window(report_service, params):
+    """Return the resolved date filter of the report params and the time bucket it is valid for"""
+
+    try:
+        lt, gte, time_zone = report_service._es_get_date_filters(params)
+    except Exception:
+        lt = gte = time_zone = None
+
+    window = {"lt": lt, "gte": gte, "time_zone": time_zone, "bucket": None}
+    if lt is None or lt == "now":
+        # no date filter or a window ending now, the data keeps changing
+        window["bucket"] = _get_now_bucket()
+    elif "now" in lt:
+        formats = [
+            ROUNDING_BUCKETS.get("/" + value.rpartition("/")[2], "%Y-%m-%dT%H") for value in (lt, gte) if "/" in value
+        ]
+        local_now = utc_to_local(app.config["DEFAULT_TIMEZONE"], utcnow())
+        window["bucket"] = local_now.strftime(max(formats, key=len))
+    else:
+        try:
+            end = datetime.strptime(lt, "%Y-%m-%dT%H:%M:%S%z")
+        except ValueError:
+            end = None
+        if end is None or end > utcnow():
+            window["bucket"] = _get_now_bucket()
+
+    return window
+
+
+def _get_now_bucket():
+    return int(time.time() // app.config.get("ANALYTICS_CACHE_NOW_WINDOW", 300))
+
+
+def get_or_compute(key, compute, encode, decode):
+    """Return the cached value of ``key``, or compute and cache it
+
+    Only one caller computes a missing value, the others wait for it up to ``ANALYTICS_CACHE_LOCK_TIMEOUT``
+    seconds and then compute it themselves.
+    """
+
+    redis = app.redis
+    ttl = app.config.get("ANALYTICS_CACHE_TTL", 3600)
+    lock_timeout = app.config.get("ANALYTICS_CACHE_LOCK_TIMEOUT", 120)
+
+    cached = redis.get(key)
+    if cached is not None:
+        return decode(cached)
+
+    lock_key = LOCK_KEY.format(key)
+    token = str(uuid4())
+    if not redis.set(lock_key, token, nx=True, ex=lock_timeout):
+        deadline = time.time() + lock_timeout
+        while time.time() < deadline:
+            time.sleep(0.2)
+            cached = redis.get(key)
+            if cached is not None:
+                return decode(cached)
+            if not redis.exists(lock_key):
+                break
+        logger.warning(f"Computing {key} after waiting for another process")
+
+    try:
+        value = compute()
+        redis.set(key, encode(value), ex=ttl)
+        return value
+    finally:
+        if redis.get(lock_key) == token.encode():
+            redis.delete(lock_key)
+
+
+class CachedReportService:
+    """Report service proxy caching the results of ``get`` without a request"""
+
+    def __init__(self, report_type, service):
+        self.report_type = report_type
+        self.service = service
+
+    def __getattr__(self, name):
+        return getattr(self.service, name)
+
+    def get(self, req=None, **lookup):
+        if req is not None:
+            return self.service.get(req=req, **lookup)
+
+        params = lookup.get("params") or {}
+        key = make_key(
+            REPORT_KEY,
+            self.report_type,
+            params,
+            lookup.get("translations"),
+            lookup.get("return_type"),
+            get_data_window(self.service, params),
+        )
+        report = get_or_compute(
+            key,
+            lambda: list(self.service.get(req=None, **lookup))[0],
+            json_util.dumps,
+            json_util.loads,
+        )
+        return [report]
+
+
+def cached_get_report_service(get_report_service):
+    def get_cached_report_service(report_type):
+        service = get_report_service(report_type)
+        if service is None:
+            return None
+        return CachedReportService(report_type, service)
+
+    get_cached_report_service.tga_cached = True
+    return get_cached_report_service
+
+
+def cached_generate_report(generate_report):
+    def generate_cached_report(options, *args, **kwargs):
+        key = make_key(CHART_KEY, options, args, kwargs)
+        return get_or_compute(key, lambda: generate_report(options, *args, **kwargs), _encode_chart, _decode_chart)
+
+    generate_cached_report.tga_cached = True
+    return generate_cached_report
+
+
+def _encode_chart(value):
+    # html tables are rendered to str, charts and csv to bytes
+    return b"s" + value.encode("utf-8") if isinstance(value, str) else b"b" + value
+
+
+def _decode_chart(value):
+    return value[1:].decode("utf-8") if value[:1] == b"s" else value[1:]
+
+
+def init_app(app):
+    if not app.config.get("ANALYTICS_CACHE_ENABLED") or not app.config.get("ANALYTICS_ENABLE_SCHEDULED_REPORTS"):
+        return
+
+    try:
+        from analytics.email_report import email_report
+    except ImportError:
+        return
+
+    if not hasattr(email_report, "get_report_service") or not hasattr(email_report, "generate_report"):
+        logger.warning("Unable to enable analytics cache, email report does not use the expected functions")
+        return
+
+    if not getattr(email_report.get_report_service, "tga_cached", False):
+        email_report.get_report_service = cached_get_report_service(email_report.get_report_service)
+    if not getattr(email_report.generate_report, "tga_cached", False):
+        email_report.generate_report = cached_generate_report(email_report.generate_report)
@@ -0,0 +1,6 @@
+from .index_from_mongo import IndexFromMongoParallel  # noqa
+from .export_crossref import ExportCrossref  # noqa
+from .replace_words import ReplaceWordsCommand  # noqa
+from .archive_crossref_queue import ArchiveCrossrefQueue  # noqa
+from .publish_replay import CapturePublish, ReplayPublish  # noqa
+from .sequence_benchmark import SequenceBenchmark  # noqa
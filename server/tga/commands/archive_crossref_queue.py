@@ -0,0 +1,106 @@
+import gzip
+import os
+import time
+from datetime import timedelta
+
+import pymongo
+import superdesk
+from bson import BSON, json_util
+from flask import current_app as app
+
+from superdesk import config
+from superdesk.publish.publish_queue import QueueState
+from superdesk.utc import utcnow
+from tga.publish.compression import decompress_payload
+
+DELIVERY_TYPE = "crossref_http_post"
+
+
+class ArchiveCrossrefQueue(superdesk.Command):
+    """Move old successful Crossref publish queue entries to compressed archive files.
+
+    Entries completed more than ``--days`` ago are written as JSON lines to gzip files in
+    ``--output-dir``, ``--file-size`` entries per file, and removed from the publish queue
+    once their file is complete. With ``LEGAL_ARCHIVE`` enabled, only entries already moved
+    to the legal archive are taken.
+
+    Use ``--dry-run`` to report the entries and their size without writing or removing anything.
+
+    Example:
+    ::
+
+        $ python manage.py tga:archive_crossref_queue --days 365 --output-dir /var/archive/publish_queue
+        $ python manage.py tga:archive_crossref_queue --days 90 --dry-run
+
+    """
+
+    option_list = [
+        superdesk.Option("--days", "-d", type=int, default=365),
+        superdesk.Option("--output-dir", "-o", default="."),
+        superdesk.Option("--file-size", "-s", type=int, default=10000, help="entries per archive file"),
+        superdesk.Option("--dry-run", action="store_true"),
+    ]
+
+    def run(self, days, output_dir, file_size, dry_run):
+        collection = app.data.get_mongo_collection("publish_queue")
+        lookup = {
+            "destination.delivery_type": DELIVERY_TYPE,
+            "state": QueueState.SUCCESS.value,
+            "completed_at": {"$lt": utcnow() - timedelta(days=days)},
+        }
+        if app.config.get("LEGAL_ARCHIVE"):
+            lookup["moved_to_legal"] = True
+
+        stats = {"entries": 0, "files": 0, "stored_bytes": 0, "archive_bytes": 0, "payload_bytes": 0, "xml_bytes": 0}
+        start = time.time()
+        cursor = collection.find(lookup).sort(config.ID_FIELD, pymongo.ASCENDING).batch_size(500)
+        batch = []
+        for entry in cursor:
+            batch.append(entry)
+            if len(batch) >= file_size:
+                self.archive_batch(collection, batch, output_dir, stats, dry_run)
+                batch = []
+        if batch:
+            self.archive_batch(collection, batch, output_dir, stats, dry_run)
+
+        print(
+            "{} {} entries in {} file(s) in {:.1f}s".format(
+                "Would archive" if dry_run else "Archived", stats["entries"], stats["files"], time.time() - start
+            )
+        )
+        print(
+            "Removed from publish_queue: {} bytes, archive files: {} bytes, saved: {} bytes".format(
+                stats["stored_bytes"], stats["archive_bytes"], stats["stored_bytes"] - stats["archive_bytes"]
+            )
+        )
+        print(
+            "Crossref payloads: {} bytes stored for {} bytes of XML".format(stats["payload_bytes"], stats["xml_bytes"])
+        )
+
+    def archive_batch(self, collection, batch, output_dir, stats, dry_run):
+        path = os.path.join(
+            output_dir, "publish_queue_crossref_{}_{}.jsonl.gz".format(batch[0][config.ID_FIELD], len(batch))
+        )
+        for entry in batch:
+            stats["stored_bytes"] += len(BSON.encode(entry))
+            stats["payload_bytes"] += len(entry.get("formatted_item") or "")
+            stats["xml_bytes"] += len(decompress_payload(entry.get("formatted_item")) or "")
+        stats["entries"] += len(batch)
+        stats["files"] += 1
+
+        if dry_run:
+            return
+
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as archive_file:
+            for entry in batch:
+                archive_file.write(json_util.dumps(entry) + "\n")
+        os.replace(tmp_path, path)
+        stats["archive_bytes"] += os.path.getsize(path)
+
+        # only remove the entries once their archive file is complete
+        collection.delete_many({config.ID_FIELD: {"$in": [entry[config.ID_FIELD] for entry in batch]}})
+        print("{} entries archived to {}".format(len(batch), path))
+
+
+superdesk.command("tga:archive_crossref_queue", ArchiveCrossrefQueue())
@@ -0,0 +1,221 @@
+import io
+import logging
+import sys
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pymongo
+import superdesk
+from flask import current_app as app
+from lxml import etree
+
+from superdesk import config
+from superdesk.metadata.item import ITEM_TYPE, CONTENT_TYPE, ITEM_STATE, CONTENT_STATE
+from superdesk.utc import utc
+from tga.publish.formatters.crossref import CrossrefFormatter
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ["zip", "xml"]
+
+
+class ExportCrossref(superdesk.Command):
+    """Export the Crossref documents of several items, without generating publish sequence numbers.
+
+    Items are selected by ``--id`` or by their ``versioncreated`` date (``--start-date`` and ``--end-date``,
+    inclusive, ``YYYY-MM-DD``), items without a DOI are skipped. The documents are rendered by
+    ``--workers`` threads and streamed to ``--output`` (``-`` for stdout) either as a zip with one
+    document per item, or as a single ``doi_batch`` with one record per item.
+
+    Example:
+    ::
+
+        $ python manage.py tga:export_crossref --start-date 2022-01-01 --end-date 2022-06-30 -o crossref.zip
+        $ python manage.py tga:export_crossref --id urn:newsml:abc --id urn:newsml:def --format xml -o batch.xml
+
+    """
+
+    option_list = [
+        superdesk.Option("--id", "-i", dest="ids", action="append"),
+        superdesk.Option("--start-date", "-s"),
+        superdesk.Option("--end-date", "-e"),
+        superdesk.Option("--format", "-f", dest="export_format", choices=EXPORT_FORMATS, default="zip"),
+        superdesk.Option("--output", "-o", required=True),
+        superdesk.Option("--workers", "-w", type=int, default=4),
+    ]
+
+    def run(self, ids, start_date, end_date, export_format, output, workers):
+        if not ids and not start_date and not end_date:
+            raise SystemExit("Provide item ids or a date range")
+
+        stats = {"exported": 0, "start": time.time()}
+        items = get_export_items(ids, parse_date(start_date), parse_date(end_date, end_of_day=True))
+        documents = render_documents(items, workers, stats)
+        chunks = iter_zip(documents) if export_format == "zip" else iter_doi_batch(documents)
+
+        if output == "-":
+            write_chunks(chunks, sys.stdout.buffer)
+        else:
+            with open(output, "wb") as output_file:
+                write_chunks(chunks, output_file)
+
+        elapsed = time.time() - stats["start"]
+        print(
+            "Exported {} item(s) in {:.1f}s ({:.0f} items/s)".format(
+                stats["exported"], elapsed, stats["exported"] / elapsed if elapsed else 0
+            ),
+            file=sys.stderr,
+        )
+
+
+def parse_date(value, end_of_day=False):
+    if not value:
+        return None
+    date = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=utc)
+    return date + timedelta(days=1) if end_of_day else date
+
+
+def get_export_items(ids=None, start_date=None, end_date=None, batch_size=100):
+    """Yield the text items with a DOI, either by id in the given order or published within the date range"""
+
+    lookup = {ITEM_TYPE: CONTENT_TYPE.TEXT}
+    if ids:
+        lookup[config.ID_FIELD] = {"$in": ids}
+    else:
+        lookup[ITEM_STATE] = {"$in": [CONTENT_STATE.PUBLISHED, CONTENT_STATE.CORRECTED]}
+    if start_date or end_date:
+        lookup["versioncreated"] = {}
+        if start_date:
+            lookup["versioncreated"]["$gte"] = start_date
+        if end_date:
+            lookup["versioncreated"]["$lt"] = end_date
+
+    cursor = app.data.get_mongo_collection("archive").find(lookup)
+    if ids:
+        # keep the order of the given ids
+        found = {item[config.ID_FIELD]: item for item in cursor}
+        items = (found[item_id] for item_id in ids if item_id in found)
+    else:
+        items = cursor.sort(config.ID_FIELD, pymongo.ASCENDING).batch_size(batch_size)
+
+    for item in items:
+        if not (item.get("extra") or {}).get("doi"):
+            logger.warning(f"Skipping item {item[config.ID_FIELD]} without DOI")
+            continue
+        yield item
+
+
+def render_documents(items, workers, stats=None):
+    """Render the Crossref documents of ``items`` using a pool of ``workers`` threads
+
+    Yields ``(item, document)`` in the order of ``items``, rendering at most ``workers * 2``
+    items ahead of the consumer. Items failing to render are logged and skipped.
+    """
+
+    formatter = CrossrefFormatter()
+
+    # workers run outside of the request context, so pass them the app
+    current = app._get_current_object()
+
+    def render(item):
+        with current.app_context():
+            try:
+                return formatter.export(item)
+            except Exception:
+                logger.exception(f"Failed to render Crossref document of item {item[config.ID_FIELD]}")
+                return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        items = iter(items)
+        while True:
+            for item in items:
+                pending.append((item, executor.submit(render, item)))
+                if len(pending) >= workers * 2:
+                    break
+
+            if not pending:
+                return
+
+            item, future = pending.popleft()
+            document = future.result()
+            if document is not None:
+                if stats is not None:
+                    stats["exported"] += 1
+                yield item, document
+
+
+class _ChunkOutput(io.RawIOBase):
+    """Unseekable file collecting the data written by ``zipfile`` or ``etree.xmlfile`` until it is taken"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_zip(documents):
+    """Yield a zip archive with one ``<doi>.xml`` file per rendered document"""
+
+    output = _ChunkOutput()
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for item, document in documents:
+            filename = "{}.xml".format(item["extra"]["doi"].replace("/", "_"))
+            archive.writestr(filename, document.encode(CrossrefFormatter.ENCODING))
+            yield output.take()
+    yield output.take()
+
+
+def iter_doi_batch(documents):
+    """Yield a single ``doi_batch`` document with the records of all rendered documents"""
+
+    formatter = CrossrefFormatter()
+    envelope = formatter.gen_batch_envelope()
+    body = envelope.find("{{{}}}body".format(CrossrefFormatter.message_nsmap[None]))
+    output = _ChunkOutput()
+    with etree.xmlfile(output, encoding=CrossrefFormatter.ENCODING, buffered=False) as xml_file:
+        xml_file.write_declaration()
+        with xml_file.element(envelope.tag, attrib=dict(envelope.attrib), nsmap=envelope.nsmap):
+            for element in envelope:
+                if element is not body:
+                    _write_element(xml_file, element, 1)
+            xml_file.write("\n  ")
+            with xml_file.element(body.tag):
+                yield output.take()
+                for _item, document in documents:
+                    for record in formatter.get_body_records(document):
+                        _write_element(xml_file, record, 2)
+                    yield output.take()
+                xml_file.write("\n  ")
+            xml_file.write("\n")
+    yield output.take()
+
+
+def _write_element(xml_file, element, level):
+    # the element tail is the indentation of its next sibling in the rendered document
+    element.tail = None
+    xml_file.write("\n" + "  " * level)
+    xml_file.write(element)
+
+
+def write_chunks(chunks, output_file):
+    for chunk in chunks:
+        if chunk:
+            output_file.write(chunk)
+
+
+superdesk.command("tga:export_crossref", ExportCrossref())
@@ -0,0 +1,254 @@
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Lock
+
+import pymongo
+import superdesk
+from bson import json_util
+from elasticsearch.helpers import streaming_bulk
+from flask import current_app as app
+
+from superdesk import config
+from superdesk.errors import BulkIndexError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESOURCES = ["archive", "published"]
+
+#: Fields stored by eve/superdesk which are not part of the resource schema
+META_FIELDS = ["_id", "_created", "_updated", "_etag", "_current_version", "_latest_version", "_type"]
+
+
+class IndexFromMongoState:
+    """Progress of the ``_id`` ranges, stored as JSON so an interrupted run can be resumed"""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        self.lock = Lock()
+
+    def load(self):
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as state_file:
+                self.data = json_util.loads(state_file.read())
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as state_file:
+            state_file.write(json_util.dumps(self.data))
+        os.replace(tmp_path, self.path)
+
+    def get_ranges(self, resource):
+        return (self.data.get(resource) or {}).get("ranges")
+
+    def set_ranges(self, resource, ranges):
+        with self.lock:
+            self.data[resource] = {"ranges": [{"start": start, "end": end} for start, end in ranges]}
+            self.save()
+
+    def update_range(self, resource, index, last_id=None, done=False):
+        with self.lock:
+            range_state = self.data[resource]["ranges"][index]
+            if last_id is not None:
+                range_state["last_id"] = last_id
+            if done:
+                range_state["done"] = True
+            self.save()
+
+    def clear(self, resource):
+        with self.lock:
+            self.data.pop(resource, None)
+            self.save()
+
+
+class IndexFromMongoParallel(superdesk.Command):
+    """Index ``archive`` and ``published`` from Mongo into their existing Elastic indexes in parallel.
+
+    The collection is split into ``_id`` ranges which are streamed by ``--workers`` threads,
+    each indexing its documents in bulk requests of ``--chunk-size`` documents.
+    While loading, the index refresh is disabled and the replicas are set to 0,
+    both are restored at the end.
+
+    The progress is stored in ``--state-file``, use ``--resume`` to continue an interrupted run.
+    Unlike ``app:rebuild_elastic_index`` this does not create the index or put its mapping.
+
+    Example:
+    ::
+
+        $ python manage.py tga:index_from_mongo
+        $ python manage.py tga:index_from_mongo --resource archive --workers 8 --chunk-size 1000
+        $ python manage.py tga:index_from_mongo --resume
+
+    """
+
+    option_list = [
+        superdesk.Option("--resource", "-r", dest="resources", action="append"),
+        superdesk.Option("--workers", "-w", type=int, default=4),
+        superdesk.Option("--chunk-size", "-c", type=int, default=500),
+        superdesk.Option("--ranges", type=int, help="number of _id ranges, defaults to 4 per worker"),
+        superdesk.Option("--state-file", default="index_from_mongo.json"),
+        superdesk.Option("--resume", action="store_true"),
+        superdesk.Option("--no-projection", action="store_true", help="index the complete Mongo documents"),
+    ]
+
+    def run(self, resources, workers, chunk_size, ranges, state_file, resume, no_projection):
+        state = IndexFromMongoState(state_file)
+        if resume:
+            state.load()
+
+        for resource in resources or DEFAULT_RESOURCES:
+            if not app.data._search_backend(resource):
+                raise SystemExit(f"Resource {resource} is not indexed in Elastic")
+
+            if not resume or not state.get_ranges(resource):
+                collection = app.data.get_mongo_collection(resource)
+                state.set_ranges(resource, get_id_ranges(collection, ranges or workers * 4))
+
+            with bulk_load_settings(resource):
+                self.index_resource(resource, state, workers, chunk_size, not no_projection)
+
+            state.clear(resource)
+
+    def index_resource(self, resource, state, workers, chunk_size, use_projection):
+        ranges = state.get_ranges(resource)
+        pending = [index for index, range_state in enumerate(ranges) if not range_state.get("done")]
+        print(f"Indexing {resource}: {len(pending)} of {len(ranges)} _id range(s) to do, {workers} worker(s)")
+
+        progress = {"indexed": 0, "start": time.time(), "lock": Lock()}
+        projection = get_projection(resource) if use_projection else None
+
+        # workers run outside of the request context, so pass them the app
+        current = app._get_current_object()
+
+        def index_range(index):
+            with current.app_context():
+                return self.index_range(resource, index, ranges[index], state, chunk_size, projection, progress)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            failed = sum(executor.map(index_range, pending))
+
+        elapsed = time.time() - progress["start"]
+        print(
+            "Indexed {} {} documents in {:.1f}s ({:.0f} docs/s)".format(
+                progress["indexed"], resource, elapsed, progress["indexed"] / elapsed if elapsed else 0
+            )
+        )
+
+        if failed:
+            raise BulkIndexError(resource=resource, errors=f"{failed} document(s) failed, use --resume to retry")
+
+    def index_range(self, resource, index, range_state, state, chunk_size, projection, progress):
+        elastic = app.data._search_backend(resource)
+        es = elastic.elastic(resource)
+        es_index = elastic._resource_index(resource)
+
+        lookup = {}
+        if range_state.get("last_id") is not None:
+            lookup["$gt"] = range_state["last_id"]
+        elif range_state.get("start") is not None:
+            lookup["$gte"] = range_state["start"]
+        if range_state.get("end") is not None:
+            lookup["$lt"] = range_state["end"]
+
+        cursor = (
+            app.data.get_mongo_collection(resource)
+            .find({config.ID_FIELD: lookup} if lookup else {}, projection)
+            .sort(config.ID_FIELD, pymongo.ASCENDING)
+            .batch_size(chunk_size)
+        )
+
+        # results are returned in the order of the actions, keep the Mongo ids to track the progress
+        ids = deque()
+
+        def actions():
+            for doc in cursor:
+                ids.append(doc[config.ID_FIELD])
+                source = elastic._prepare_for_storage(resource, doc, {})
+                yield {"_index": es_index, "_id": str(ids[-1]), "_source": source}
+
+        failed = 0
+        indexed = 0
+        last_id = None
+        for ok, result in streaming_bulk(es, actions(), chunk_size=chunk_size, raise_on_error=False):
+            indexed += 1
+            _id = ids.popleft()
+            if not ok:
+                failed += 1
+                logger.error(f"Failed to index {resource} document: {result}")
+                continue
+
+            last_id = _id
+            if indexed % chunk_size == 0:
+                self._update_progress(resource, index, state, progress, chunk_size, last_id, failed)
+
+        self._update_progress(resource, index, state, progress, indexed % chunk_size, last_id, failed, done=not failed)
+        return failed
+
+    def _update_progress(self, resource, index, state, progress, count, last_id, failed, done=False):
+        # failed documents keep the range open, it will be indexed again on ``--resume``
+        state.update_range(resource, index, None if failed else last_id, done)
+        with progress["lock"]:
+            progress["indexed"] += count
+            elapsed = time.time() - progress["start"]
+            print(
+                "{} {}: {} docs indexed, {:.0f} docs/s".format(
+                    time.strftime("%X"), resource, progress["indexed"], progress["indexed"] / elapsed if elapsed else 0
+                )
+            )
+
+
+def get_id_ranges(collection, count):
+    """Split ``collection`` into ``count`` ranges of ``_id`` with about the same number of documents
+
+    :return: list of ``(start, end)`` tuples, ``None`` meaning an open end
+    """
+
+    total = collection.estimated_document_count()
+    step = total // count if count else 0
+    if step < 1:
+        return [(None, None)]
+
+    bounds = [None]
+    for index in range(1, count):
+        cursor = collection.find({}, {config.ID_FIELD: 1}).sort(config.ID_FIELD, pymongo.ASCENDING)
+        boundary = next(cursor.skip(index * step).limit(1), None)
+        if boundary is not None and boundary[config.ID_FIELD] != bounds[-1]:
+            bounds.append(boundary[config.ID_FIELD])
+    bounds.append(None)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def get_projection(resource):
+    schema = app.config["DOMAIN"][resource].get("schema") or {}
+    return {field: 1 for field in list(schema.keys()) + META_FIELDS}
+
+
+@contextmanager
+def bulk_load_settings(resource):
+    """Disable refresh and replicas of the resource index for the duration of a bulk load"""
+
+    elastic = app.data._search_backend(resource)
+    es = elastic.elastic(resource)
+    original = {}
+    try:
+        for index, settings in es.indices.get_settings(index=elastic._resource_index(resource)).items():
+            index_settings = settings["settings"]["index"]
+            original[index] = {
+                "refresh_interval": index_settings.get("refresh_interval"),
+                "number_of_replicas": index_settings.get("number_of_replicas"),
+            }
+            es.indices.put_settings(index=index, body={"index": {"refresh_interval": "-1", "number_of_replicas": 0}})
+        yield
+    finally:
+        for index, settings in original.items():
+            es.indices.put_settings(index=index, body={"index": settings})
+            es.indices.refresh(index=index)
+
+
+superdesk.command("tga:index_from_mongo", IndexFromMongoParallel())
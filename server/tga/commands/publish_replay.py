@@ -0,0 +1,253 @@
+import gzip
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+import pymongo
+import superdesk
+from bson import json_util
+from flask import current_app as app
+
+from superdesk import config
+from tga.commands.export_crossref import parse_date
+from tga.publish.compression import decompress_payload
+from tga.publish.replay import (
+    DELIVERY_TYPE,
+    Anonymizer,
+    CrossrefStub,
+    replay_event,
+    replay_publish_event,
+)
+from tga.utils import summarize_latencies, format_latencies
+
+#: Stages of a replayed event, in the order they run
+STAGES = ["queue", "item_publish", "item_resend", "format", "transmit", "end_to_end"]
+
+
+class CapturePublish(superdesk.Command):
+    """Capture the Crossref publish and resend events of a period to an anonymized replay file.
+
+    Events are read from the Crossref entries of the publish queue queued between ``--start-date`` and
+    ``--end-date`` (inclusive, ``YYYY-MM-DD``), with the published version of their item and their
+    Crossref output. The first entry of an item version is a publish, later ones are resends, and the
+    DOI is removed from the first publish of an item so the replay generates it.
+
+    Texts, names, ids and DOIs are anonymized with a random salt, pass the same ``--salt`` to get the
+    same anonymized ids in several captures. See ``tga:replay_publish`` to replay the file.
+
+    Example:
+    ::
+
+        $ python manage.py tga:capture_publish --start-date 2022-05-01 --end-date 2022-05-31 -o may.jsonl.gz
+
+    """
+
+    option_list = [
+        superdesk.Option("--start-date", "-s", required=True),
+        superdesk.Option("--end-date", "-e", required=True),
+        superdesk.Option("--output", "-o", required=True),
+        superdesk.Option("--salt"),
+    ]
+
+    def run(self, start_date, end_date, output, salt):
+        anonymizer = Anonymizer(salt)
+        queue = app.data.get_mongo_collection("publish_queue")
+        published = app.data.get_mongo_collection("published")
+        users = app.data.get_mongo_collection("users")
+
+        lookup = {
+            "destination.delivery_type": DELIVERY_TYPE,
+            "_created": {"$gte": parse_date(start_date), "$lt": parse_date(end_date, end_of_day=True)},
+        }
+        cursor = queue.find(lookup, {"item_id": 1, "item_version": 1, "formatted_item": 1, "_created": 1})
+        stats = {"publish": 0, "resend": 0, "missing": 0, "users": 0}
+        seen_versions = set()
+        seen_items = set()
+        seen_users = set()
+        first_created = None
+
+        with gzip.open(output, "wt", encoding="utf-8") as capture_file:
+            for entry in cursor.sort(config.DATE_CREATED, pymongo.ASCENDING).batch_size(500):
+                item = published.find_one({"item_id": entry["item_id"], "_current_version": entry.get("item_version")})
+                if not item:
+                    stats["missing"] += 1
+                    continue
+
+                # published documents are copies of the archive item, the formatter gets the archive id
+                item[config.ID_FIELD] = item["item_id"]
+                for author in item.get("authors") or []:
+                    if author.get("parent") and author["parent"] not in seen_users:
+                        seen_users.add(author["parent"])
+                        user = users.find_one({config.ID_FIELD: author["parent"]})
+                        if user:
+                            capture_file.write(json_util.dumps({"type": "user", "user": anonymizer.user(user)}) + "\n")
+                            stats["users"] += 1
+
+                version = (entry["item_id"], entry.get("item_version"))
+                action = "resend" if version in seen_versions else "publish"
+                anonymized = anonymizer.item(item)
+                if entry["item_id"] not in seen_items:
+                    anonymized["extra"].pop("doi", None)
+                seen_versions.add(version)
+                seen_items.add(entry["item_id"])
+
+                first_created = first_created or entry[config.DATE_CREATED]
+                document = decompress_payload(entry.get("formatted_item"))
+                event = {
+                    "type": "event",
+                    "action": action,
+                    "offset": (entry[config.DATE_CREATED] - first_created).total_seconds(),
+                    "item": anonymized,
+                    "output": anonymizer.output(document),
+                    "output_bytes": len((document or "").encode("utf-8")),
+                }
+                capture_file.write(json_util.dumps(event) + "\n")
+                stats[action] += 1
+
+        print(
+            "Captured {} publish and {} resend events, {} users, {} entries without a published item".format(
+                stats["publish"], stats["resend"], stats["users"], stats["missing"]
+            )
+        )
+
+
+class ReplayPublish(superdesk.Command):
+    """Replay a capture of ``tga:capture_publish`` against the local stack and report the latencies.
+
+    Run it against local Mongo, Elastic and Redis only: the anonymized authors are added to the
+    ``users`` collection and the signal receivers run as on publish (i.e. DOIs are generated).
+    Events are replayed with their captured timing divided by ``--speed``. Each event is sent to the
+    Celery worker of ``worker.py``, started with the same settings, or replayed by ``--workers``
+    threads of this process with ``--in-process``. Crossref uploads go to a stub endpoint started
+    by the command, answering after ``--crossref-delay`` milliseconds.
+
+    The latencies of the ``item_publish``/``item_resend`` signal receivers (``generate_doi``),
+    ``CrossrefFormatter.format``, ``CrossrefPushService._transmit`` and of the whole event, from
+    the time it was due, are reported with the events whose output differs from the captured one.
+
+    Example:
+    ::
+
+        $ python manage.py tga:replay_publish -i may.jsonl.gz --speed 60
+        $ python manage.py tga:replay_publish -i may.jsonl.gz --speed 600 --in-process --workers 8
+
+    """
+
+    option_list = [
+        superdesk.Option("--input", "-i", dest="input_path", required=True),
+        superdesk.Option("--speed", "-s", type=float, default=1.0, help="speed-up of the captured timing"),
+        superdesk.Option("--limit", "-l", type=int, help="replay the first events only"),
+        superdesk.Option("--in-process", action="store_true", help="replay in this process instead of Celery"),
+        superdesk.Option("--workers", "-w", type=int, default=4, help="threads used with --in-process"),
+        superdesk.Option("--crossref-delay", type=int, default=0, help="stub endpoint response time in ms"),
+        superdesk.Option("--host", default="127.0.0.1", help="address of the stub endpoint"),
+        superdesk.Option("--port", type=int, default=0, help="port of the stub endpoint"),
+        superdesk.Option("--timeout", type=int, default=60, help="seconds to wait for results from Celery"),
+    ]
+
+    def run(self, input_path, speed, limit, in_process, workers, crossref_delay, host, port, timeout):
+        events = self.load(input_path, limit)
+        if not events:
+            raise SystemExit("No events in {}".format(input_path))
+
+        stub = CrossrefStub(host, port, crossref_delay / 1000).start()
+        try:
+            start = time.time()
+            if in_process:
+                results = self.replay_in_process(events, stub.url, speed, workers)
+            else:
+                results = self.replay_in_worker(events, stub.url, speed, timeout)
+            elapsed = time.time() - start
+        finally:
+            stub.stop()
+
+        print_report(results, len(events), elapsed, stub)
+
+    def load(self, input_path, limit=None):
+        users = app.data.get_mongo_collection("users")
+        events = []
+        with gzip.open(input_path, "rt", encoding="utf-8") as capture_file:
+            for line in capture_file:
+                record = json_util.loads(line)
+                if record["type"] == "user":
+                    user = record["user"]
+                    users.update_one({config.ID_FIELD: user[config.ID_FIELD]}, {"$set": user}, upsert=True)
+                elif record["type"] == "event":
+                    events.append(record)
+                    if limit and len(events) >= limit:
+                        break
+        return events
+
+    def iter_schedule(self, events, speed):
+        """Yield the events with their due time, sleeping until then"""
+
+        start = time.time() + 1
+        for event in events:
+            scheduled = start + event["offset"] / speed
+            delay = scheduled - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            yield event, scheduled
+
+    def replay_in_process(self, events, crossref_url, speed, workers):
+        current_app = app._get_current_object()
+
+        def replay(event, scheduled):
+            with current_app.app_context():
+                return replay_event(event, crossref_url, scheduled)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(replay, event, scheduled) for event, scheduled in self.iter_schedule(events, speed)
+            ]
+            return [future.result() for future in futures]
+
+    def replay_in_worker(self, events, crossref_url, speed, timeout):
+        result_key = "tga:replay:{}".format(uuid4().hex)
+        for event, scheduled in self.iter_schedule(events, speed):
+            replay_publish_event.apply_async(args=[json_util.dumps(event), crossref_url, scheduled, result_key])
+
+        results = []
+        while len(results) < len(events):
+            popped = app.redis.blpop(result_key, timeout=timeout)
+            if popped is None:
+                missing = len(events) - len(results)
+                print("No result from the worker for {}s, {} events missing".format(timeout, missing))
+                break
+            results.append(json.loads(popped[1]))
+        app.redis.delete(result_key)
+        return results
+
+
+def print_report(results, count, elapsed, stub):
+    errors = [result["error"] for result in results if result["error"]]
+    print(
+        "Replayed {} of {} events ({} publish, {} resend) in {:.1f}s, {} errors, {} outputs differ".format(
+            len(results),
+            count,
+            sum(1 for result in results if result["action"] == "publish"),
+            sum(1 for result in results if result["action"] == "resend"),
+            elapsed,
+            len(errors),
+            sum(1 for result in results if result["output_match"] is False),
+        )
+    )
+
+    for stage in STAGES:
+        values = [result["stages"][stage] for result in results if stage in result["stages"]]
+        if values:
+            print("  {}: {}".format(stage, format_latencies(summarize_latencies(values))))
+
+    receivers = sorted({name for result in results for name in result["receivers"]})
+    for name in receivers:
+        values = [result["receivers"][name] for result in results if name in result["receivers"]]
+        print("  {}: {}".format(name, format_latencies(summarize_latencies(values))))
+
+    for error in sorted(set(errors))[:10]:
+        print("  error: {}".format(error))
+    print("Crossref stub: {} uploads, {} bytes".format(stub.uploads, stub.upload_bytes))
+
+
+superdesk.command("tga:capture_publish", CapturePublish())
+superdesk.command("tga:replay_publish", ReplayPublish())
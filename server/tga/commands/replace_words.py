@@ -0,0 +1,202 @@
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pymongo
+import superdesk
+from bson import ObjectId
+from eve.methods.common import resolve_document_etag
+from flask import current_app as app
+
+from apps.archive.common import insert_into_versions
+from apps.content import push_content_notification
+from superdesk import config
+from superdesk.macros import macro_replacement_fields
+from superdesk.metadata.item import ITEM_STATE, CONTENT_STATE, PUBLISH_STATES
+from superdesk.utc import utcnow
+from macros.replace_words import compile_words, get_replace_words, replace_in_item
+
+#: Compiled words of the worker process, set by ``_init_worker``
+_compiled_words = None
+
+
+def _init_worker(words_list):
+    global _compiled_words
+    _compiled_words = compile_words(words_list)
+
+
+def _replace_in_items(items):
+    """Return ``(item, updates, diff)`` of the items changed by the macro"""
+
+    changed = []
+    for item in items:
+        updates, diff = replace_in_item(item, _compiled_words)
+        if updates:
+            changed.append((item, updates, diff))
+    return changed
+
+
+class ReplaceWordsCommand(superdesk.Command):
+    """Apply the ``Replace_Words`` macro to all the archive items of a desk.
+
+    Items are read in chunks of ``--chunk-size`` and the macro runs in ``--workers`` processes.
+    Only the changed items are written, using bulk updates of the changed fields, and then re-indexed.
+    Their version is bumped and added to ``archive_versions``, but the archive update hooks do not run,
+    so the changes are not in the item history. Locked, spiked and published items are skipped, as are
+    items modified while the command runs.
+
+    Use ``--dry-run`` to print the words which would be replaced in each item without saving.
+
+    Example:
+    ::
+
+        $ python manage.py tga:replace_words --desk Sports --dry-run
+        $ python manage.py tga:replace_words --desk Sports --workers 4
+
+    """
+
+    option_list = [
+        superdesk.Option("--desk", "-d", dest="desks", action="append", required=True, help="desk name or id"),
+        superdesk.Option("--workers", "-w", type=int, default=2),
+        superdesk.Option("--chunk-size", "-c", type=int, default=200),
+        superdesk.Option("--dry-run", action="store_true"),
+    ]
+
+    def run(self, desks, workers, chunk_size, dry_run):
+        words_list = get_replace_words()
+        if not words_list:
+            raise SystemExit("The replace_words vocabulary is missing or empty")
+
+        desk_ids = [self.get_desk_id(desk) for desk in desks]
+        stats = {"scanned": 0, "changed": 0, "saved": 0, "conflicts": 0, "start": time.time()}
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(words_list,)) as executor:
+            pending = deque()
+            chunks = iter_chunks(get_items(desk_ids), chunk_size)
+            while True:
+                for chunk in chunks:
+                    stats["scanned"] += len(chunk)
+                    pending.append(executor.submit(_replace_in_items, chunk))
+                    if len(pending) >= workers * 2:
+                        break
+
+                if not pending:
+                    break
+
+                changed = pending.popleft().result()
+                stats["changed"] += len(changed)
+                if dry_run:
+                    self.print_preview(changed)
+                elif changed:
+                    self.save(changed, stats)
+                self.print_progress(stats)
+
+        self.print_progress(stats, done=True)
+
+    def get_desk_id(self, desk):
+        lookup = {config.ID_FIELD: ObjectId(desk)} if ObjectId.is_valid(desk) else {"name": desk}
+        desk_doc = app.data.get_mongo_collection("desks").find_one(lookup, {config.ID_FIELD: 1})
+        if not desk_doc:
+            raise SystemExit(f"Desk {desk} not found")
+        return desk_doc[config.ID_FIELD]
+
+    def save(self, changed, stats):
+        now = utcnow()
+        collection = app.data.get_mongo_collection("archive")
+        ids = [item[config.ID_FIELD] for item, *_rest in changed]
+        current_docs = {doc[config.ID_FIELD]: doc for doc in collection.find({config.ID_FIELD: {"$in": ids}})}
+
+        requests = []
+        versions = {}
+        for item, updates, _diff in changed:
+            current = current_docs.get(item[config.ID_FIELD])
+            if current is None or current.get(config.ETAG) != item.get(config.ETAG):
+                stats["conflicts"] += 1
+                continue
+
+            # bump the version and compute the etag of the whole document, same as ``ArchiveService.update``
+            updates = dict(updates, **{config.LAST_UPDATED: now})
+            if config.VERSION in current:
+                updates[config.VERSION] = current[config.VERSION] + 1
+            updated = dict(current, **updates)
+            resolve_document_etag(updated, "archive")
+            updates[config.ETAG] = updated[config.ETAG]
+            versions[item[config.ID_FIELD]] = updated
+            requests.append(
+                pymongo.UpdateOne(
+                    # skip the item if it was locked or modified since it was read
+                    {config.ID_FIELD: item[config.ID_FIELD], config.ETAG: item.get(config.ETAG), "lock_user": None},
+                    {"$set": updates},
+                )
+            )
+
+        if requests:
+            result = collection.bulk_write(requests, ordered=False)
+            stats["saved"] += result.modified_count
+            stats["conflicts"] += len(requests) - result.matched_count
+
+        # the updated documents are read back, so conflicting items are indexed with their current content
+        docs = list(collection.find({config.ID_FIELD: {"$in": ids}}))
+        for doc in docs:
+            updated = versions.get(doc[config.ID_FIELD])
+            if updated is not None and doc.get(config.ETAG) == updated[config.ETAG]:
+                insert_into_versions(doc=doc)
+        app.data._search_backend("archive").bulk_insert("archive", docs)
+        push_content_notification(docs)
+
+    def print_preview(self, changed):
+        for item, updates, diff in changed:
+            print(
+                "{} {!r}: {} ({})".format(
+                    item[config.ID_FIELD],
+                    item.get("headline") or item.get("slugline"),
+                    ", ".join("{!r} -> {!r}".format(old, new) for old, new in diff.items()),
+                    ", ".join(sorted(updates)),
+                )
+            )
+
+    def print_progress(self, stats, done=False):
+        elapsed = time.time() - stats["start"]
+        print(
+            "{}{} items scanned, {} changed, {} saved, {} conflicts, {:.0f} items/s".format(
+                "Done: " if done else "",
+                stats["scanned"],
+                stats["changed"],
+                stats["saved"],
+                stats["conflicts"],
+                stats["scanned"] / elapsed if elapsed else 0,
+            )
+        )
+
+
+def get_items(desk_ids, batch_size=500):
+    """Yield the unlocked, unpublished archive items of the desks with the macro fields only"""
+
+    projection = {field: 1 for field in macro_replacement_fields}
+    projection.update({config.ID_FIELD: 1, config.ETAG: 1})
+    lookup = {
+        "task.desk": {"$in": desk_ids},
+        ITEM_STATE: {"$nin": list(PUBLISH_STATES) + [CONTENT_STATE.SPIKED]},
+        "lock_user": None,
+    }
+    cursor = (
+        app.data.get_mongo_collection("archive")
+        .find(lookup, projection)
+        .sort(config.ID_FIELD, pymongo.ASCENDING)
+        .batch_size(batch_size)
+    )
+    yield from cursor
+
+
+def iter_chunks(items, chunk_size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+superdesk.command("tga:replace_words", ReplaceWordsCommand())
@@ -0,0 +1,105 @@
+import time
+import multiprocessing
+from uuid import uuid4
+
+import pymongo
+import superdesk
+from flask import current_app as app
+
+from tga.publish.sequences import SequenceBlockAllocator
+from tga.utils import summarize_latencies, format_latencies
+
+
+def _benchmark_worker(mongo_uri, dbname, key, block_size, count, results):
+    client = pymongo.MongoClient(mongo_uri)
+    collection = client[dbname]["sequences"]
+    latencies = []
+    numbers = []
+    if block_size > 1:
+        allocator = SequenceBlockAllocator(block_size, lambda: collection)
+
+        def next_number():
+            return allocator.next(key)
+
+    else:
+
+        def next_number():
+            return collection.find_one_and_update(
+                {"key": key},
+                {"$inc": {"sequence_number": 1}},
+                upsert=True,
+                return_document=pymongo.ReturnDocument.AFTER,
+            )["sequence_number"]
+
+    started = time.time()
+    for _i in range(count):
+        start = time.perf_counter()
+        numbers.append(next_number())
+        latencies.append((time.perf_counter() - start) * 1000)
+    finished = time.time()
+
+    client.close()
+    results.put((numbers, latencies, started, finished))
+
+
+class SequenceBenchmark(superdesk.Command):
+    """Compare per number and block allocation of sequence numbers under contention.
+
+    Starts ``--processes`` worker processes which all generate ``--count`` numbers of one sequence,
+    first with an atomic increment per number, then with blocks of ``--block-size`` numbers.
+    A temporary sequence is used and removed afterwards.
+
+    Example:
+    ::
+
+        $ python manage.py tga:sequence_benchmark --processes 8 --count 500 --block-size 50
+
+    """
+
+    option_list = [
+        superdesk.Option("--processes", "-p", type=int, default=4),
+        superdesk.Option("--count", "-c", type=int, default=500),
+        superdesk.Option("--block-size", "-b", type=int, default=50),
+    ]
+
+    def run(self, processes, count, block_size):
+        collection = app.data.get_mongo_collection("sequences")
+        for label, size in (("per number", 1), ("block of {}".format(block_size), block_size)):
+            key = "tga_sequence_benchmark_{}".format(uuid4().hex)
+            try:
+                self.benchmark(label, collection, key, size, processes, count)
+            finally:
+                collection.delete_one({"key": key})
+
+    def benchmark(self, label, collection, key, block_size, processes, count):
+        # workers open their own Mongo connection, the forked one must not be used
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(
+                target=_benchmark_worker,
+                args=(app.config["MONGO_URI"], collection.database.name, key, block_size, count, results),
+            )
+            for _i in range(processes)
+        ]
+
+        for worker in workers:
+            worker.start()
+        worker_results = [results.get() for _worker in workers]
+        for worker in workers:
+            worker.join()
+
+        elapsed = max(result[3] for result in worker_results) - min(result[2] for result in worker_results)
+        all_numbers = [number for result in worker_results for number in result[0]]
+        monotonic = all(result[0] == sorted(result[0]) for result in worker_results)
+        unique = len(all_numbers) == len(set(all_numbers))
+        latencies = [latency for result in worker_results for latency in result[1]]
+
+        print(
+            "{}: {} numbers in {:.2f}s ({:.0f}/s), unique={} monotonic per worker={}".format(
+                label, len(all_numbers), elapsed, len(all_numbers) / elapsed, unique, monotonic
+            )
+        )
+        print("  latency: " + format_latencies(summarize_latencies(latencies)))
+
+
+superdesk.command("tga:sequence_benchmark", SequenceBenchmark())
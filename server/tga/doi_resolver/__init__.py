@@ -0,0 +1,32 @@
+"""DOI resolver served by the content API
+
+The content API process keeps an in memory index of DOI to item id (see :mod:`tga.doi_resolver.api`),
+this module publishes the DOIs of items being published so every content API process
+updates its index without querying the database.
+"""
+
+import logging
+
+from flask import current_app as app
+
+from superdesk import signals
+from tga.doi_resolver.index import encode_update
+
+logger = logging.getLogger(__name__)
+
+
+def publish_doi(_sender, item, updates=None):
+    doi = (item.get("extra") or {}).get("doi")
+    if not doi:
+        return
+
+    try:
+        app.redis.publish(app.config["DOI_RESOLVER_CHANNEL"], encode_update(doi, item["guid"]))
+    except Exception:
+        # the content API reloads its index every ``DOI_RESOLVER_RELOAD_INTERVAL``, so this must not fail the publish
+        logger.exception(f"Failed to publish DOI {doi}")
+
+
+def init_app(_app):
+    # connected after ``tga.signal_hooks.generate_doi``, so the item has its DOI already
+    signals.item_publish.connect(publish_doi)
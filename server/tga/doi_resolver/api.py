@@ -0,0 +1,89 @@
+"""DOI resolver endpoint of the content API
+
+``GET /api/doi/<doi>`` (or ``/api/doi?doi=<doi>``) returns the id and URL of the item with the DOI,
+from an in memory :class:`DOIIndex` updated on publish. Each process loads the index and starts its
+:class:`DOIIndexUpdater` thread on its first request rather than in ``init_app``, as threads started
+before gunicorn forks its workers (i.e. with ``--preload``) do not run in the workers.
+Responses have an ETag and can be cached for ``DOI_RESOLVER_MAX_AGE`` seconds.
+
+Added to the content API by ``content_api_wsgi``.
+"""
+
+import hashlib
+import logging
+import os
+from threading import Lock
+
+import redis
+import superdesk
+from flask import current_app as app, request, jsonify, abort
+
+from tga.doi_resolver.index import DOIIndex, DOIIndexUpdater
+
+logger = logging.getLogger(__name__)
+
+bp = superdesk.Blueprint("doi_resolver", __name__)
+
+index = DOIIndex()
+
+#: Seconds the first requests of a process wait for the index to load
+LOAD_TIMEOUT = 30
+
+_updater = None
+_updater_pid = None
+_updater_lock = Lock()
+
+
+def get_item_url(doi, item_id):
+    template = app.config.get("DOI_RESOLVER_URL_TEMPLATE") or (app.config["CONTENTAPI_URL"].rstrip("/") + "/items/{id}")
+    return template.format(id=item_id, doi=doi)
+
+
+@bp.route("/doi", methods=["GET"])
+@bp.route("/doi/<path:doi>", methods=["GET"])
+def resolve_doi(doi=None):
+    doi = doi or request.args.get("doi")
+    if not doi:
+        abort(400, description="Missing DOI")
+
+    item_id = index.get(doi)
+    if item_id is None:
+        response = jsonify({"doi": doi, "_message": "DOI not found"})
+        response.status_code = 404
+        return response
+
+    response = jsonify({"doi": doi, "item_id": item_id, "url": get_item_url(doi, item_id)})
+    response.set_etag(hashlib.sha1("{}:{}".format(doi, item_id).encode("utf-8")).hexdigest())
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config.get("DOI_RESOLVER_MAX_AGE", 300)
+    return response.make_conditional(request)
+
+
+def start_updater():
+    """Start the index updater of this process and wait for the index to load"""
+
+    global _updater, _updater_pid
+
+    if request.blueprint != bp.name:
+        return
+
+    if _updater_pid != os.getpid():
+        with _updater_lock:
+            if _updater_pid != os.getpid():
+                _updater = DOIIndexUpdater(
+                    index,
+                    app.data.get_mongo_collection("items"),
+                    redis.from_url(app.config["REDIS_URL"]),
+                    app.config["DOI_RESOLVER_CHANNEL"],
+                    app.config.get("DOI_RESOLVER_RELOAD_INTERVAL", 0),
+                )
+                _updater.start()
+                _updater_pid = os.getpid()
+
+    if not index.loaded.wait(LOAD_TIMEOUT):
+        logger.warning("DOI index not loaded yet")
+
+
+def init_app(app):
+    superdesk.blueprint(bp, app)
+    app.before_request(start_updater)
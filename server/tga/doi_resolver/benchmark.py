@@ -0,0 +1,132 @@
+"""DOI resolver latency benchmark
+
+Measures the in memory index (size and lookups per second for ``--index-size`` synthetic DOIs),
+and, with ``--url``, the latency of the resolver endpoint for the given DOIs, both for full
+responses and for conditional requests answered with ``304 Not Modified``.
+
+Usage (from the ``server`` directory)::
+
+    python -m tga.doi_resolver.benchmark --index-size 200000
+    python -m tga.doi_resolver.benchmark --url http://localhost:5400/api/doi --doi 10.54377/f5f3-c543 -n 5000 -c 16
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from threading import local
+from uuid import uuid4
+
+import requests
+
+from tga.doi_resolver.index import DOIIndex
+from tga.utils import summarize_latencies, format_latencies
+
+
+class _Collection:
+    """Stands in for the ``items`` collection"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, *_args):
+        return iter(self.docs)
+
+
+def _generate_items(size):
+    for _i in range(size):
+        yield {"_id": str(uuid4()), "extra": {"doi": "10.54377/{}".format(uuid4().hex[:12])}}
+
+
+def benchmark_index(size, lookups=1000000):
+    # the items are generated while loading, so their strings are part of the measured memory
+    tracemalloc.start()
+    index = DOIIndex()
+    index.load(_Collection(_generate_items(size)))
+    memory, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    docs = list(_generate_items(size))
+    start = time.perf_counter()
+    DOIIndex().load(_Collection(docs))
+    load_time = time.perf_counter() - start
+    del docs
+
+    dois = list(index.items)
+    sample = [random.choice(dois) for _i in range(lookups)]
+    start = time.perf_counter()
+    for doi in sample:
+        index.get(doi)
+    lookup_time = time.perf_counter() - start
+
+    print(
+        "index: {} DOIs loaded in {:.2f}s, {:.1f} MB ({:.0f} bytes/DOI), {:.0f} lookups/s".format(
+            len(index), load_time, memory / 1e6, memory / size if size else 0, lookups / lookup_time
+        )
+    )
+
+
+def benchmark_endpoint(url, dois, count, concurrency):
+    sessions = local()
+
+    def get_session():
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        return sessions.session
+
+    def resolve(doi, etag=None):
+        headers = {"If-None-Match": etag} if etag else {}
+        start = time.perf_counter()
+        response = get_session().get("{}/{}".format(url.rstrip("/"), doi), headers=headers)
+        return (time.perf_counter() - start) * 1000, response
+
+    etags = {}
+    for doi in dois:
+        _latency, response = resolve(doi)
+        if response.status_code != 200:
+            raise SystemExit("{} returned {} for {}".format(url, response.status_code, doi))
+        etags[doi] = response.headers.get("ETag")
+
+    for label, conditional in (("full", False), ("conditional", True)):
+        sample = [random.choice(dois) for _i in range(count)]
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda doi: resolve(doi, etags[doi] if conditional else None), sample))
+        elapsed = time.time() - start
+
+        statuses = {}
+        for _latency, response in results:
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        print(
+            "{}: {} requests in {:.1f}s ({:.0f} req/s) statuses={} {}".format(
+                label,
+                count,
+                elapsed,
+                count / elapsed if elapsed else 0,
+                statuses,
+                format_latencies(summarize_latencies([latency for latency, _response in results])),
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-size", type=int, default=100000, help="synthetic DOIs of the index benchmark")
+    parser.add_argument("--url", help="resolver endpoint, i.e. http://localhost:5400/api/doi")
+    parser.add_argument("--doi", dest="dois", action="append", help="DOI to resolve, can be repeated")
+    parser.add_argument("--requests", "-n", type=int, default=2000)
+    parser.add_argument("--concurrency", "-c", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.index_size:
+        benchmark_index(args.index_size)
+
+    if args.url:
+        if not args.dois:
+            parser.error("--doi is required with --url")
+        benchmark_endpoint(args.url, args.dois, args.requests, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
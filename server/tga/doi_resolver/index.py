@@ -0,0 +1,127 @@
+import json
+import logging
+import time
+from threading import Thread, Event
+
+logger = logging.getLogger(__name__)
+
+
+class DOIIndex:
+    """In memory map of DOI to content API item id
+
+    Loaded with a single projection query of ``extra.doi`` and ``versioncreated``, without sorting
+    as ``versioncreated`` is not indexed. Items sharing a DOI (i.e. rewrites) resolve to the latest
+    one by ``versioncreated``.
+
+    DOIs set on publish are kept across reloads for ``pending_ttl`` seconds,
+    until the item is stored by the content API.
+    """
+
+    def __init__(self, pending_ttl=3600):
+        self.items = {}
+        self.pending = {}
+        self.pending_ttl = pending_ttl
+        self.loaded_at = None
+        self.loaded = Event()
+
+    def load(self, collection):
+        cursor = collection.find(
+            {"extra.doi": {"$exists": True, "$nin": [None, ""]}},
+            {"extra.doi": 1, "versioncreated": 1},
+        )
+
+        items = {}
+        versions = {}
+        for doc in cursor:
+            doi = doc["extra"]["doi"]
+            versioncreated = doc.get("versioncreated")
+            if doi in items and not _is_newer(versioncreated, versions[doi]):
+                continue
+            items[doi] = str(doc["_id"])
+            versions[doi] = versioncreated
+
+        now = time.time()
+        self.pending = {
+            doi: (item_id, added)
+            for doi, (item_id, added) in list(self.pending.items())
+            if items.get(doi) != item_id and now - added < self.pending_ttl
+        }
+        items.update({doi: item_id for doi, (item_id, _added) in self.pending.items()})
+
+        # swap the whole dict, lookups never see a partially loaded index
+        self.items = items
+        self.loaded_at = now
+        self.loaded.set()
+        return len(items)
+
+    def get(self, doi):
+        return self.items.get(doi)
+
+    def set(self, doi, item_id):
+        self.items[doi] = str(item_id)
+        self.pending[doi] = (str(item_id), time.time())
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _is_newer(versioncreated, previous):
+    if versioncreated is None:
+        return previous is None
+    return previous is None or versioncreated >= previous
+
+
+def encode_update(doi, item_id):
+    return json.dumps({"doi": doi, "id": str(item_id)})
+
+
+def decode_update(message):
+    data = json.loads(message)
+    return data["doi"], data["id"]
+
+
+class DOIIndexUpdater(Thread):
+    """Apply DOI updates published on the Redis ``channel``
+
+    The index is loaded once subscribed, so it has every update published before, and loaded again
+    on every reconnect to pick up the updates missed while Redis was not reachable. With
+    ``reload_interval`` it is reloaded periodically too, for updates which failed to be published.
+    """
+
+    def __init__(self, index, collection, redis_client, channel, reload_interval=300):
+        super().__init__(name="doi-index-updater", daemon=True)
+        self.index = index
+        self.collection = collection
+        self.redis = redis_client
+        self.channel = channel
+        self.reload_interval = reload_interval
+        self.stopped = Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.listen()
+            except Exception:
+                logger.exception("DOI index updates failed, retrying")
+                self.stopped.wait(5)
+
+    def listen(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        try:
+            count = self.index.load(self.collection)
+            logger.info(f"Loaded {count} DOIs")
+
+            while not self.stopped.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if message and message.get("type") == "message":
+                    doi, item_id = decode_update(message["data"])
+                    self.index.set(doi, item_id)
+
+                if self.reload_interval and time.time() - (self.index.loaded_at or 0) >= self.reload_interval:
+                    self.index.load(self.collection)
+        finally:
+            pubsub.close()
+
+    def stop(self):
+        self.stopped.set()
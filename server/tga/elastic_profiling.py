@@ -0,0 +1,151 @@
+"""Opt-in profiling of the Elastic queries made by the tga code
+
+Enable with ``ELASTIC_PROFILING_ENABLED``. Every query sent through :func:`search` then records
+the ``took`` time reported by Elastic, the wall time of the call and the shard counts, per callsite.
+Queries slower than ``ELASTIC_PROFILING_SLOW_MS`` are logged with their source, and a summary of
+latency percentiles per callsite is logged every ``ELASTIC_PROFILING_SUMMARY_EVERY`` queries.
+
+With ``ELASTIC_PROFILING_ES_PROFILE`` the queries are also run with ``"profile": true`` and the
+slow query log includes the query time spent on each shard.
+"""
+
+import logging
+import time
+from collections import defaultdict, deque
+from threading import Lock
+
+from eve.utils import ParsedRequest
+from flask import current_app as app, json
+
+from superdesk import get_resource_service
+from tga.utils import summarize_latencies, format_latencies
+
+logger = logging.getLogger(__name__)
+
+
+class ElasticProfiler:
+    """Keeps the latest ``max_samples`` timings of every callsite"""
+
+    def __init__(self, max_samples=1000):
+        self.max_samples = max_samples
+        self.took = defaultdict(self._new_samples)
+        self.wall = defaultdict(self._new_samples)
+        self.counts = defaultdict(int)
+        self.lock = Lock()
+
+    def _new_samples(self):
+        return deque(maxlen=self.max_samples)
+
+    def record(self, callsite, took, wall):
+        """Record timings (in ms) of a query
+
+        :return: number of queries recorded for the callsite so far
+        """
+
+        with self.lock:
+            if took is not None:
+                self.took[callsite].append(took)
+            self.wall[callsite].append(wall)
+            self.counts[callsite] += 1
+            return self.counts[callsite]
+
+    def summary(self):
+        with self.lock:
+            return {
+                callsite: {
+                    "queries": self.counts[callsite],
+                    "took": summarize_latencies(list(self.took[callsite])),
+                    "wall": summarize_latencies(list(self.wall[callsite])),
+                }
+                for callsite in self.counts
+            }
+
+    def reset(self):
+        with self.lock:
+            self.took.clear()
+            self.wall.clear()
+            self.counts.clear()
+
+
+profiler = ElasticProfiler()
+
+
+def search(resource, query, callsite, **args):
+    """Run the raw Elastic ``query`` using the ``resource`` service
+
+    :param resource: name of the resource service, i.e. ``published``
+    :param query: Elastic query
+    :param callsite: name used to group the profiling results
+    :param args: extra request args, i.e. ``repo``
+    """
+
+    service = get_resource_service(resource)
+    if not app.config.get("ELASTIC_PROFILING_ENABLED"):
+        return service.get(req=_get_request(query, args), lookup=None)
+
+    if app.config.get("ELASTIC_PROFILING_ES_PROFILE"):
+        query = dict(query, profile=True)
+
+    start = time.perf_counter()
+    cursor = service.get(req=_get_request(query, args), lookup=None)
+    wall = (time.perf_counter() - start) * 1000
+
+    response = getattr(cursor, "hits", None) or {}
+    took = response.get("took")
+    count = profiler.record(callsite, took, wall)
+
+    if wall >= app.config.get("ELASTIC_PROFILING_SLOW_MS", 500):
+        logger.warning(
+            "Slow Elastic query callsite={} took={}ms wall={:.1f}ms shards={} profile={} source={}".format(
+                callsite,
+                took,
+                wall,
+                _format_shards(response.get("_shards")),
+                _format_profile(response.get("profile")),
+                json.dumps(query),
+            )
+        )
+
+    summary_every = app.config.get("ELASTIC_PROFILING_SUMMARY_EVERY", 100)
+    if summary_every and count % summary_every == 0:
+        log_summary()
+
+    return cursor
+
+
+def log_summary():
+    for callsite, summary in profiler.summary().items():
+        logger.info(
+            "Elastic query profile callsite={} queries={} took: {} wall: {}".format(
+                callsite, summary["queries"], format_latencies(summary["took"]), format_latencies(summary["wall"])
+            )
+        )
+
+
+def _get_request(query, args):
+    req = ParsedRequest()
+    req.args = dict(args, source=json.dumps(query))
+    return req
+
+
+def _format_shards(shards):
+    if not shards:
+        return None
+    return "{}/{} failed={}".format(shards.get("successful"), shards.get("total"), shards.get("failed"))
+
+
+def _format_profile(profile):
+    """Return the query time spent on each shard in ms"""
+
+    if not profile:
+        return None
+
+    shard_times = []
+    for shard in profile.get("shards") or []:
+        nanos = sum(
+            query.get("time_in_nanos", 0)
+            for shard_search in shard.get("searches") or []
+            for query in shard_search.get("query") or []
+        )
+        shard_times.append("{}:{:.1f}ms".format(shard.get("id"), nanos / 1e6))
+    return ",".join(shard_times)
@@ -1,2 +1,3 @@
 from .formatters.crossref import CrossrefFormatter  # noqa
 from .transmitters.crossref import CrossrefPushService  # noqa
+from .replay import replay_publish_event  # noqa
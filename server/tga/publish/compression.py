@@ -0,0 +1,31 @@
+"""Compressed storage of formatted Crossref documents in the publish queue
+
+With ``CROSSREF_COMPRESS_PAYLOADS`` the formatter stores the zlib compressed document base64 encoded
+with the :data:`COMPRESSED_PREFIX`, as ``formatted_item`` must be a string. Compressed documents can
+not be read in the publish queue UI and the legal archive, so the setting is off by default.
+
+Values without the prefix are returned as they are, so queue items formatted with the setting off
+keep working.
+"""
+
+import base64
+import zlib
+
+COMPRESSED_PREFIX = "crossref+zlib:"
+ENCODING = "utf-8"
+
+
+def compress_payload(payload, level=6):
+    compressed = zlib.compress(payload.encode(ENCODING), level)
+    return COMPRESSED_PREFIX + base64.b64encode(compressed).decode("ascii")
+
+
+def decompress_payload(value):
+    if not value or not value.startswith(COMPRESSED_PREFIX):
+        return value
+    compressed = base64.b64decode(value.replace(COMPRESSED_PREFIX, "", 1))
+    return zlib.decompress(compressed).decode(ENCODING)
+
+
+def is_compressed(value):
+    return bool(value) and value.startswith(COMPRESSED_PREFIX)
@@ -1,6 +1,10 @@
+import time
+from collections import OrderedDict
+from threading import Lock
 from lxml import etree
 import logging
 from bson import ObjectId
+from flask import current_app as app
 
 from superdesk import get_resource_service
 from superdesk.publish.formatters import Formatter
@@ -8,6 +12,8 @@ from superdesk.metadata.item import ITEM_TYPE, CONTENT_TYPE
 from superdesk.text_utils import get_text
 from superdesk.utc import utcnow
 from superdesk.errors import FormatterError
+from tga.publish.sequences import generate_sequence_number
+from tga.publish.compression import compress_payload
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +34,68 @@ FormatterError._codes.update({
     25000: "Failed to generate article metadata for Crossref"
 })
 
+# Placeholders for the per call ``head`` values in cached documents
+DOI_BATCH_ID_PLACEHOLDER = "__CROSSREF_DOI_BATCH_ID__"
+TIMESTAMP_PLACEHOLDER = "__CROSSREF_TIMESTAMP__"
+
+
+class CrossrefOutputCache:
+    """LRU cache of rendered Crossref documents
+
+    Entries are keyed by item ``_id``, ``_current_version``, DOI and contributors,
+    and only the latest entry of an item is kept, so a new version replaces the old one.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.item_keys = {}
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, max_size):
+        with self.lock:
+            previous_key = self.item_keys.get(key[0])
+            if previous_key is not None and previous_key != key:
+                self.entries.pop(previous_key, None)
+
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            self.item_keys[key[0]] = key
+            while len(self.entries) > max_size:
+                old_key, _value = self.entries.popitem(last=False)
+                if self.item_keys.get(old_key[0]) == old_key:
+                    del self.item_keys[old_key[0]]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.item_keys.clear()
+
+
+class CrossrefUserCache:
+    """Names of the author users, each kept for ``CROSSREF_USER_CACHE_TTL`` seconds"""
+
+    def __init__(self):
+        self.users = {}
+
+    def get(self, user_id, ttl):
+        entry = self.users.get(user_id)
+        if entry is None or time.time() - entry[1] >= ttl:
+            return None
+        return entry[0]
+
+    def set(self, user_id, user):
+        self.users[user_id] = ({key: user[key] for key in ("first_name", "last_name") if key in user}, time.time())
+
+    def clear(self):
+        self.users.clear()
+
 
 class CrossrefFormatter(Formatter):
     FORMAT_TYPE = "crossref"
@@ -48,6 +116,9 @@ class CrossrefFormatter(Formatter):
         "version": "5.3.1",
     }
 
+    output_cache = CrossrefOutputCache()
+    user_cache = CrossrefUserCache()
+
     def __init__(self):
         super().__init__()
         self.can_export = True
@@ -58,32 +129,88 @@ class CrossrefFormatter(Formatter):
     def format(self, article, subscriber, codes=None):
         try:
             self.subscriber = subscriber
-            pub_seq_num = get_resource_service("subscribers").generate_sequence_number(subscriber)
-            cr_xml = self._gen_xml(article)
-
-            return [
-                (
-                    pub_seq_num,
-                    self.XML_ROOT
-                    + etree.tostring(
-                        cr_xml,
-                        pretty_print=True,
-                        encoding="unicode",
-                        inclusive_ns_prefixes=["jats"],
-                        exclusive=True
-                    )
-                )
-            ]
+            pub_seq_num = generate_sequence_number(subscriber)
+            formatted_doc = self._render(article)
+            if app.config.get("CROSSREF_COMPRESS_PAYLOADS"):
+                formatted_doc = compress_payload(formatted_doc, app.config.get("CROSSREF_COMPRESSION_LEVEL", 6))
+            return [(pub_seq_num, formatted_doc)]
         except Exception as ex:
             raise FormatterError(25000, ex, subscriber)
 
-    def _gen_xml(self, article):
+    def format_document(self, article):
+        """Render the Crossref document of the article without generating a publish sequence number"""
+
+        try:
+            return self._render(article)
+        except Exception as ex:
+            raise FormatterError(25000, ex, None)
+
+    def gen_batch_envelope(self):
+        """Return an empty ``doi_batch`` document with a new ``head``
+
+        Add the ``body`` records of rendered documents (see :meth:`get_body_records`) to its ``body``
+        to produce a single multi-record ``doi_batch``.
+        """
+
         cr_xml = etree.Element(
             "doi_batch",
             attrib=CrossrefFormatter.debug_message_extra,
             nsmap=CrossrefFormatter.message_nsmap
         )
-        self._format_header(cr_xml, article)
+        self._format_header(cr_xml, None, *self._gen_head_values())
+        etree.SubElement(cr_xml, "body")
+        # parsed back, so the elements are in the Crossref namespace like the records
+        return etree.fromstring(self._serialize(cr_xml).encode(self.ENCODING))
+
+    def get_body_records(self, document):
+        """Return the elements of the ``body`` of a rendered document"""
+
+        root = etree.fromstring(document.encode(self.ENCODING))
+        return list(root.find("{{{}}}body".format(self.message_nsmap[None])))
+
+    def _render(self, article):
+        """Render the Crossref document of the article
+
+        The document is cached per item version, only the ``head`` values are generated on every call.
+        """
+
+        contributors = self._get_contributors(article)
+        cache_size = app.config.get("CROSSREF_FORMATTER_CACHE_SIZE", 256)
+        if not cache_size or article.get("_current_version") is None:
+            return self._serialize(self._gen_xml(article, contributors))
+
+        cache_key = (
+            str(article["_id"]),
+            article["_current_version"],
+            (article.get("extra") or {}).get("doi"),
+            tuple(contributors),
+        )
+        template = self.output_cache.get(cache_key)
+        if template is None:
+            template = self._serialize(
+                self._gen_xml(article, contributors, head=(DOI_BATCH_ID_PLACEHOLDER, TIMESTAMP_PLACEHOLDER))
+            )
+            self.output_cache.set(cache_key, template, cache_size)
+
+        doi_batch_id, timestamp = self._gen_head_values()
+        return template.replace(DOI_BATCH_ID_PLACEHOLDER, doi_batch_id, 1).replace(TIMESTAMP_PLACEHOLDER, timestamp, 1)
+
+    def _serialize(self, cr_xml):
+        return self.XML_ROOT + etree.tostring(
+            cr_xml,
+            pretty_print=True,
+            encoding="unicode",
+            inclusive_ns_prefixes=["jats"],
+            exclusive=True
+        )
+
+    def _gen_xml(self, article, contributors=None, head=None):
+        cr_xml = etree.Element(
+            "doi_batch",
+            attrib=CrossrefFormatter.debug_message_extra,
+            nsmap=CrossrefFormatter.message_nsmap
+        )
+        self._format_header(cr_xml, article, *(head or self._gen_head_values()))
 
         body_xml = etree.SubElement(cr_xml, "body")
 
@@ -94,18 +221,23 @@ class CrossrefFormatter(Formatter):
             attrib={"language": article.get("language", "en")}
         )
 
-        self._format_contributors(report_paper_metadata, article)
+        self._format_contributors(
+            report_paper_metadata,
+            contributors if contributors is not None else self._get_contributors(article)
+        )
         self._format_titles(report_paper_metadata, article)
         self._format_dates(report_paper_metadata, article)
         self._format_doi_data(report_paper_metadata, article)
 
         return cr_xml
 
-    def _format_header(self, cr_xml, article):
-        now = utcnow()
+    def _gen_head_values(self):
+        return str(ObjectId()), utcnow().strftime("%Y%m%d%H%M%S")
+
+    def _format_header(self, cr_xml, article, doi_batch_id, timestamp):
         head = etree.SubElement(cr_xml, "head")
-        etree.SubElement(head, "doi_batch_id").text = str(ObjectId())
-        etree.SubElement(head, "timestamp").text = now.strftime("%Y%m%d%H%M%S")
+        etree.SubElement(head, "doi_batch_id").text = doi_batch_id
+        etree.SubElement(head, "timestamp").text = timestamp
         depositor = etree.SubElement(head, "depositor")
         etree.SubElement(depositor, "depositor_name").text = DEPOSITOR_INFO["name"]
         etree.SubElement(depositor, "email_address").text = DEPOSITOR_INFO["email"]
@@ -128,12 +260,28 @@ class CrossrefFormatter(Formatter):
         etree.SubElement(doi_data, "doi").text = doi
         etree.SubElement(doi_data, "resource").text = PUBLIC_DOI_URL_PREFIX + doi
 
-    def _format_contributors(self, xml_node, article):
-        if not article.get("authors"):
+    def _format_contributors(self, xml_node, contributors):
+        if not contributors:
             return
 
+        contributors_node = etree.SubElement(xml_node, "contributors")
+        for sequence, role, first_name, last_name in contributors:
+            person = etree.SubElement(
+                contributors_node,
+                "person_name",
+                attrib={"sequence": sequence, "contributor_role": role}
+            )
+            etree.SubElement(person, "given_name").text = first_name
+            etree.SubElement(person, "surname").text = last_name
+
+    def _get_contributors(self, article):
+        """Resolve the article authors to ``(sequence, role, first_name, last_name)`` tuples"""
+
+        if not article.get("authors"):
+            return []
+
         users_service = get_resource_service("users")
-        contributors = etree.SubElement(xml_node, "contributors")
+        contributors = []
         is_first = True
         for author in article["authors"]:
             try:
@@ -146,27 +294,36 @@ class CrossrefFormatter(Formatter):
                     logger.warning("Unknown user")
                     user = {}
             else:
-                try:
-                    user = next(users_service.find({"_id": user_id}))
-                except StopIteration:
-                    logger.warning(f"Unknown user: {user_id}")
-                    user = {}
+                user = self._get_user(users_service, user_id)
 
-            attributes = {
-                "sequence": "first" if is_first else "additional",
-                "contributor_role": (
+            contributors.append((
+                "first" if is_first else "additional",
+                (
                     author_to_contributor_role_map.get(author.get("role", "author")) or
                     author_to_contributor_role_map["author"]
-                )
-            }
+                ),
+                user["first_name"],
+                user["last_name"],
+            ))
             is_first = False
-            person = etree.SubElement(contributors, "person_name", attrib=attributes)
-            etree.SubElement(person, "given_name").text = user["first_name"]
-            etree.SubElement(person, "surname").text = user["last_name"]
+
+        return contributors
+
+    def _get_user(self, users_service, user_id):
+        ttl = app.config.get("CROSSREF_USER_CACHE_TTL", 0)
+        user = self.user_cache.get(user_id, ttl) if ttl else None
+        if user is None:
+            try:
+                user = next(users_service.find({"_id": user_id}))
+            except StopIteration:
+                logger.warning(f"Unknown user: {user_id}")
+                return {}
+            if ttl:
+                self.user_cache.set(user_id, user)
+        return user
 
     def export(self, article):
         if self.can_format(self.FORMAT_TYPE, article):
-            sequence, formatted_doc = self.format(article, {"_id": "0"}, None)[0]
-            return formatted_doc.replace("''", "'")
+            return self.format_document(article).replace("''", "'")
         else:
             raise Exception()
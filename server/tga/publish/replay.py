@@ -0,0 +1,300 @@
+"""Capture and replay of Crossref publish traffic
+
+A capture (see ``tga:capture_publish``) is a gzip JSON lines file of the Crossref publish and resend
+events in the order they were queued, each with its anonymized item and Crossref output, and of the
+anonymized users referenced as authors. Replaying it (see ``tga:replay_publish``) runs every event
+through the ``item_publish``/``item_resend`` signal receivers (i.e. ``generate_doi``),
+``CrossrefFormatter.format`` and ``CrossrefPushService._transmit`` against a stub Crossref endpoint,
+either in the Celery worker (``worker.py``) or in the replay process, and times every stage.
+"""
+
+import hashlib
+import json
+import logging
+import random
+import re
+import string
+import time
+from copy import deepcopy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from uuid import uuid4
+
+from bson import ObjectId, json_util
+from flask import current_app as app
+from lxml import etree
+
+from superdesk import signals
+from superdesk.celery_app import celery
+from superdesk.text_utils import get_text
+from tga.publish.compression import decompress_payload
+from tga.publish.formatters.crossref import PUBLIC_DOI_URL_PREFIX, CrossrefFormatter
+from tga.publish.transmitters.crossref import CrossrefPushService
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_TYPE = "crossref_http_post"
+RESULT_TTL = 3600
+
+#: Item fields kept in a capture, the ones used by the Crossref formatter and the signal receivers
+CAPTURE_FIELDS = (
+    "_id",
+    "guid",
+    "type",
+    "state",
+    "language",
+    "_current_version",
+    "versioncreated",
+    "firstcreated",
+    "schedule_settings",
+    "authors",
+    "headline",
+    "slugline",
+    "abstract",
+    "body_html",
+    "word_count",
+)
+
+#: Subscriber of the replayed events, sequence numbers are generated for it as for the Crossref subscriber
+REPLAY_SUBSCRIBER = {"_id": "tga_publish_replay", "name": "Crossref publish replay"}
+REPLAY_SENDER = "tga.publish.replay"
+
+WORD_RE = re.compile(r"\w+")
+MARKUP_RE = re.compile(r"(<[^>]*>|&#?\w+;)")
+CROSSREF_NS = CrossrefFormatter.message_nsmap[None]
+
+
+class Anonymizer:
+    """Replace the names, texts and ids of captured items and users
+
+    Words are scrambled keeping their length, case and markup, the same word always gives the same
+    result for a ``salt``, so author names and titles of the recorded Crossref output match the ones
+    the formatter renders from the anonymized item and users.
+    """
+
+    def __init__(self, salt=None):
+        self.salt = salt or uuid4().hex
+
+    def text(self, value, salt=None):
+        if not value or not isinstance(value, str):
+            return value
+
+        salt = salt or self.salt
+        parts = MARKUP_RE.split(value)
+        return "".join(
+            part if index % 2 else WORD_RE.sub(lambda match: self._scramble(match.group(), salt), part)
+            for index, part in enumerate(parts)
+        )
+
+    def _scramble(self, word, salt):
+        rng = random.Random(hashlib.sha256((salt + word).encode("utf-8")).digest())
+        return "".join(
+            (
+                rng.choice(string.digits)
+                if char.isdigit()
+                else rng.choice(string.ascii_uppercase if char.isupper() else string.ascii_lowercase)
+            )
+            for char in word
+        )
+
+    def id(self, value):
+        return hashlib.sha256((self.salt + str(value)).encode("utf-8")).hexdigest()[:24]
+
+    def user_id(self, value):
+        return ObjectId(self.id(value))
+
+    def doi(self, doi):
+        if not doi:
+            return doi
+        prefix, _sep, _suffix = doi.partition("/")
+        suffix = self.id(doi)[:8]
+        return "{}/{}-{}".format(prefix, suffix[:4], suffix[4:])
+
+    def item(self, item):
+        anonymized = {field: deepcopy(item[field]) for field in CAPTURE_FIELDS if field in item}
+        anonymized["_id"] = anonymized["guid"] = "urn:replay:{}".format(self.id(item["_id"]))
+        anonymized["extra"] = {"doi": self.doi((item.get("extra") or {}).get("doi"))}
+        for field in ("headline", "slugline", "abstract"):
+            if item.get(field):
+                anonymized[field] = self.text(item[field])
+        if item.get("body_html"):
+            # the body is not part of the Crossref output, it is not scrambled consistently
+            anonymized["body_html"] = self.text(item["body_html"], salt=uuid4().hex)
+        anonymized["authors"] = [
+            {
+                "parent": self.user_id(author["parent"]) if author.get("parent") else None,
+                "name": self.text(author.get("name")),
+                "role": author.get("role"),
+            }
+            for author in item.get("authors") or []
+        ]
+        return anonymized
+
+    def user(self, user):
+        user_id = self.user_id(user["_id"])
+        return {
+            "_id": user_id,
+            "username": "replay_{}".format(user_id),
+            "first_name": self.text(user.get("first_name")),
+            "last_name": self.text(user.get("last_name")),
+            "display_name": self.text(user.get("display_name")),
+            "is_active": True,
+            "is_enabled": True,
+        }
+
+    def output(self, document):
+        """Anonymize a rendered Crossref document the same way as its item and authors"""
+
+        if not document:
+            return document
+
+        root = etree.fromstring(document.encode("utf-8"))
+        for element in root.iter(*("{{{}}}{}".format(CROSSREF_NS, tag) for tag in ("given_name", "surname"))):
+            element.text = self.text(element.text)
+        for element in root.iter("{{{}}}title".format(CROSSREF_NS)):
+            element.text = self.text(element.text)
+        for element in root.iter("{{{}}}doi_batch_id".format(CROSSREF_NS)):
+            element.text = self.id(element.text)
+        for doi_data in root.iter("{{{}}}doi_data".format(CROSSREF_NS)):
+            doi = doi_data.find("{{{}}}doi".format(CROSSREF_NS))
+            if doi is None:
+                continue
+            doi.text = self.doi(doi.text)
+            resource = doi_data.find("{{{}}}resource".format(CROSSREF_NS))
+            if resource is not None:
+                resource.text = PUBLIC_DOI_URL_PREFIX + doi.text
+        return etree.tostring(root, encoding="unicode")
+
+
+def get_record_values(document):
+    """Return the elements of the ``body`` of a Crossref document, without the DOI which may be generated"""
+
+    root = etree.fromstring(decompress_payload(document).encode("utf-8"))
+    body = root.find("{{{}}}body".format(CROSSREF_NS))
+    values = []
+    for element in body.iter():
+        tag = etree.QName(element).localname
+        if tag not in ("doi", "resource"):
+            values.append((tag, get_text(element.text or "").strip(), sorted(element.attrib.items())))
+    return values
+
+
+class CrossrefStub(ThreadingHTTPServer):
+    """Stands in for the Crossref deposit endpoint, accepting every upload after ``delay`` seconds"""
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0):
+        super().__init__((host, port), _CrossrefStubHandler)
+        self.delay = delay
+        self.uploads = 0
+        self.upload_bytes = 0
+        self.lock = Lock()
+
+    @property
+    def url(self):
+        return "http://{}:{}/servlet/deposit".format(*self.server_address[:2])
+
+    def start(self):
+        Thread(target=self.serve_forever, name="crossref-stub", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _CrossrefStubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        size = len(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+        with self.server.lock:
+            self.server.uploads += 1
+            self.server.upload_bytes += size
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        body = b"<html><body><h2>SUCCESS</h2></body></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _elapsed(start):
+    return (time.perf_counter() - start) * 1000
+
+
+def _send_signal(action, item, receivers):
+    """Call the signal receivers of the event one by one, to time each of them"""
+
+    if action == "resend":
+        signal, kwargs = signals.item_resend, {"item": item}
+    else:
+        signal, kwargs = signals.item_publish, {"item": item, "updates": {}}
+
+    for receiver in signal.receivers_for(REPLAY_SENDER):
+        start = time.perf_counter()
+        receiver(REPLAY_SENDER, **kwargs)
+        receivers["{}:{}".format(signal.name, getattr(receiver, "__name__", repr(receiver)))] = _elapsed(start)
+
+
+def replay_event(event, crossref_url, scheduled):
+    """Replay a captured event, return the latencies (in ms) of its stages
+
+    ``scheduled`` is the time the event was due, the ``queue`` stage is the delay until it started
+    and ``end_to_end`` the time from then until the Crossref upload completed.
+    """
+
+    started = time.time()
+    stage = "item_resend" if event["action"] == "resend" else "item_publish"
+    result = {
+        "action": event["action"],
+        "stages": {"queue": (started - scheduled) * 1000},
+        "receivers": {},
+        "output_match": None,
+        "error": None,
+    }
+    item = deepcopy(event["item"])
+
+    try:
+        start = time.perf_counter()
+        _send_signal(event["action"], item, result["receivers"])
+        result["stages"][stage] = _elapsed(start)
+
+        start = time.perf_counter()
+        ((_sequence_number, formatted_item),) = CrossrefFormatter().format(item, REPLAY_SUBSCRIBER)
+        result["stages"]["format"] = _elapsed(start)
+
+        queue_item = {
+            "item_id": item["_id"],
+            "formatted_item": formatted_item,
+            "destination": {
+                "delivery_type": DELIVERY_TYPE,
+                "config": {"crossref_url": crossref_url, "username": "replay", "password": "replay"},
+            },
+        }
+        start = time.perf_counter()
+        CrossrefPushService()._transmit(queue_item, REPLAY_SUBSCRIBER)
+        result["stages"]["transmit"] = _elapsed(start)
+        result["stages"]["end_to_end"] = (time.time() - scheduled) * 1000
+
+        if event.get("output"):
+            result["output_match"] = get_record_values(formatted_item) == get_record_values(event["output"])
+    except Exception as ex:
+        logger.exception("Failed to replay {} of {}".format(event["action"], item.get("_id")))
+        result["error"] = "{}: {}".format(type(ex).__name__, ex)
+
+    return result
+
+
+@celery.task(soft_time_limit=300)
+def replay_publish_event(event, crossref_url, scheduled, result_key):
+    """Replay a captured event in the worker, the result is pushed to the ``result_key`` Redis list"""
+
+    result = replay_event(json_util.loads(event), crossref_url, scheduled)
+    app.redis.rpush(result_key, json.dumps(result))
+    app.redis.expire(result_key, RESULT_TTL)
@@ -0,0 +1,116 @@
+"""Block allocation of subscriber publish sequence numbers
+
+``SubscribersService.generate_sequence_number`` does an atomic increment of the subscriber
+sequence for every formatted item, so bulk publishing contends on a single document.
+:class:`SequenceBlockAllocator` reserves ``block_size`` numbers with a single increment of the
+same sequence and hands them out from the worker's memory.
+
+Numbers are unique and increasing within a worker. Numbers reserved but not used before
+the worker exits are skipped, and the sequence wraps to its minimum once the maximum is reached,
+same as with ``generate_sequence_number``.
+"""
+
+import os
+import logging
+from threading import Lock
+
+import pymongo
+import superdesk
+from flask import current_app as app
+
+from superdesk import config
+
+logger = logging.getLogger(__name__)
+
+
+def get_subscriber_sequence_key(subscriber):
+    # same key as used by ``SubscribersService.generate_sequence_number``
+    return "subscribers_{_id})".format(_id=subscriber[config.ID_FIELD])
+
+
+def get_subscriber_sequence_limits(subscriber):
+    if subscriber.get("sequence_num_settings"):
+        return subscriber["sequence_num_settings"]["min"], subscriber["sequence_num_settings"]["max"]
+    return 1, app.config["MAX_VALUE_OF_PUBLISH_SEQUENCE"]
+
+
+class SequenceBlockAllocator:
+    """Hands out sequence numbers from blocks reserved in the ``sequences`` collection
+
+    :param block_size: number of sequence numbers reserved at once
+    :param get_collection: returns the ``sequences`` pymongo collection
+    """
+
+    def __init__(self, block_size, get_collection):
+        self.block_size = block_size
+        self.get_collection = get_collection
+        self.blocks = {}
+        self.lock = Lock()
+        self.pid = os.getpid()
+
+    def next(self, key, min_seq_number=1, max_seq_number=None):
+        with self.lock:
+            if self.pid != os.getpid():
+                # blocks reserved before fork belong to the parent process
+                self.blocks = {}
+                self.pid = os.getpid()
+
+            block = self.blocks.get(key)
+            if block is None or block[0] > block[1]:
+                block = self.blocks[key] = self._reserve(key, min_seq_number, max_seq_number)
+
+            sequence_number = block[0]
+            block[0] += 1
+            return sequence_number
+
+    def _reserve(self, key, min_seq_number, max_seq_number):
+        collection = self.get_collection()
+        while True:
+            end = collection.find_one_and_update(
+                {"key": key},
+                {"$inc": {"sequence_number": self.block_size}},
+                upsert=True,
+                return_document=pymongo.ReturnDocument.AFTER,
+            )["sequence_number"]
+            if end < min_seq_number:
+                # the sequence is below the subscriber minimum, move it up unless another worker already did
+                collection.update_one(
+                    {"key": key, "sequence_number": end},
+                    {"$set": {"sequence_number": min_seq_number - 1}},
+                )
+                continue
+
+            start = max(end - self.block_size + 1, min_seq_number)
+            if not max_seq_number or end <= max_seq_number:
+                return [start, end]
+
+            # reset the sequence, unless another worker already did
+            collection.update_one(
+                {"key": key, "sequence_number": end},
+                {"$set": {"sequence_number": min_seq_number - 1}},
+            )
+            if start <= max_seq_number:
+                return [start, max_seq_number]
+
+
+_allocator = None
+
+
+def generate_sequence_number(subscriber):
+    """Generate the next publish sequence number of the subscriber
+
+    Uses block allocation when ``CROSSREF_SEQUENCE_BLOCK_SIZE`` is set,
+    otherwise ``SubscribersService.generate_sequence_number``.
+    """
+
+    global _allocator
+
+    block_size = app.config.get("CROSSREF_SEQUENCE_BLOCK_SIZE")
+    if not block_size or block_size <= 1:
+        return superdesk.get_resource_service("subscribers").generate_sequence_number(subscriber)
+
+    if _allocator is None or _allocator.block_size != block_size:
+        _allocator = SequenceBlockAllocator(block_size, lambda: app.data.get_mongo_collection("sequences"))
+
+    min_seq_number, max_seq_number = get_subscriber_sequence_limits(subscriber)
+    return _allocator.next(get_subscriber_sequence_key(subscriber), min_seq_number, max_seq_number)
@@ -5,6 +5,7 @@ from flask import current_app as app
 
 from superdesk.publish.transmitters.http_push import HTTPPushService, errors
 from superdesk.publish import register_transmitter
+from tga.publish.compression import decompress_payload
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +14,7 @@ class CrossrefPushService(HTTPPushService):
     NAME = "Crossref HTTP Post"
 
     def _transmit(self, queue_item, subscriber):
-        item = queue_item["formatted_item"]
+        item = decompress_payload(queue_item["formatted_item"])
         destination = queue_item.get("destination", {})
         config = destination.get("config") or {}
         url = config.get("crossref_url")
@@ -1,10 +1,10 @@
 from uuid import uuid4
 import logging
 
-from eve.utils import ParsedRequest, config
-from flask import json
+from eve.utils import config
 
 from superdesk import get_resource_service, signals
+from tga.elastic_profiling import search
 
 logger = logging.getLogger(__name__)
 CROSSREF_DOI_PREFIX = "10.54377"
@@ -71,7 +71,6 @@ def _doi_exists(doi):
 def _get_published_items_for_id(item_id):
     """Get all items in the ``published`` collection for ``item_id``"""
 
-    service = get_resource_service("published")
     query = {
         "query": {
             "bool": {
@@ -82,10 +81,8 @@ def _get_published_items_for_id(item_id):
         },
         "sort": [{"versioncreated": "desc"}],
     }
-    req = ParsedRequest()
-    req.args = {"source": json.dumps(query), "repo": "published"}
 
-    return service.get(req=req, lookup=None)
+    return search("published", query, "signal_hooks._get_published_items_for_id", repo="published")
 
 
 def init_app(_app):
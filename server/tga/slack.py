@@ -0,0 +1,239 @@
+"""Batched, rate-limit aware dispatch of Slack messages
+
+Planning and assignment notifications post a ``chat.postMessage`` call per event. When enabled,
+those calls are queued in Redis instead, merged per channel (or user) over a short window and
+sent by a Celery task routed to the dedicated ``slack`` queue, sharing one pooled HTTP connection per worker.
+
+Disabled by default, enable it with ``SLACK_DISPATCH_ENABLED``. The ``slack`` queue is part of
+``CELERY_TASK_QUEUES``, so every worker started without ``-Q`` consumes it too, the ``slack``
+process of the Procfile only adds a worker dedicated to it::
+
+    celery -A worker worker -Q "${SUPERDESK_CELERY_PREFIX}slack" -c 1
+"""
+
+import json
+import logging
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from slackclient import SlackClient
+
+from flask import current_app as app
+from superdesk.celery_app import celery
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "tga:slack:"
+PENDING_KEY = KEY_PREFIX + "pending:{}"
+SCHEDULED_KEY = KEY_PREFIX + "scheduled:{}"
+RETRY_AFTER_KEY = KEY_PREFIX + "retry_after"
+
+#: Extra lifetime of the ``scheduled`` marker, so a lost task does not block a channel forever
+SCHEDULED_GRACE = 60
+
+_session = None
+
+
+class SlackRateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Slack rate limited, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class SlackWebClient:
+    """Minimal Slack Web API client using a pooled ``requests`` session"""
+
+    def __init__(self, token, api_url="https://slack.com/api/", session=None, timeout=(5, 30)):
+        self.token = token
+        self.api_url = api_url.rstrip("/") + "/"
+        self.session = session or get_session()
+        self.timeout = timeout
+
+    def post_message(self, channel, **kwargs):
+        payload = dict(kwargs, channel=channel)
+        response = self.session.post(
+            self.api_url + "chat.postMessage",
+            data=json.dumps(payload),
+            headers={
+                "Authorization": f"Bearer {self.token}",
+                "Content-Type": "application/json; charset=utf-8",
+            },
+            timeout=self.timeout,
+        )
+
+        if response.status_code == 429:
+            raise SlackRateLimited(_parse_retry_after(response.headers.get("Retry-After")))
+
+        response.raise_for_status()
+        data = response.json()
+        if not data.get("ok"):
+            if data.get("error") == "ratelimited":
+                raise SlackRateLimited(_parse_retry_after(response.headers.get("Retry-After")))
+            logger.error(f"Slack rejected message to '{channel}': {data.get('error')}")
+        return data
+
+
+class DispatchingSlackClient:
+    """Drop-in replacement for ``slackclient.SlackClient``
+
+    ``chat.postMessage`` calls are queued for the dispatcher, all other API calls
+    (user and channel lookups) are passed through to the regular client.
+    """
+
+    def __init__(self, token, *args, **kwargs):
+        self.token = token
+        self._client = SlackClient(token, *args, **kwargs)
+
+    def api_call(self, method, timeout=None, **kwargs):
+        if method == "chat.postMessage" and kwargs.get("channel"):
+            queue_message(**kwargs)
+            return {"ok": True, "queued": True}
+
+        return self._client.api_call(method, timeout=timeout, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def _parse_retry_after(value):
+    try:
+        return max(1, int(float(value)))
+    except (TypeError, ValueError):
+        return 1
+
+
+def get_session():
+    """Return the per process ``requests`` session used for all Slack calls"""
+
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        _session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+    return _session
+
+
+def merge_messages(messages, max_length=3000):
+    """Merge queued ``chat.postMessage`` kwargs into as few messages as possible
+
+    Only consecutive messages with the same other arguments (``as_user``, ``link_names``...)
+    are merged, their texts are joined by new lines and their attachments are concatenated.
+    A new batch is started once the merged text would exceed ``max_length`` characters.
+    """
+
+    merged = []
+    current = None
+    current_options = None
+    for message in messages:
+        text = message.get("text") or ""
+        options = _get_options(message)
+        if current is not None and options == current_options and len(current["text"]) + len(text) + 1 <= max_length:
+            current["text"] = "\n".join(filter(None, [current["text"], text]))
+            current["attachments"].extend(_get_attachments(message))
+            continue
+
+        current = dict(message, text=text, attachments=_get_attachments(message))
+        current_options = options
+        merged.append(current)
+
+    for message in merged:
+        if message["attachments"]:
+            message["attachments"] = json.dumps(message["attachments"])
+        else:
+            message.pop("attachments")
+    return merged
+
+
+def _get_options(message):
+    return {key: value for key, value in message.items() if key not in ("text", "attachments")}
+
+
+def _get_attachments(message):
+    attachments = message.get("attachments") or []
+    if isinstance(attachments, str):
+        attachments = json.loads(attachments)
+    return list(attachments)
+
+
+def queue_message(channel, **kwargs):
+    """Queue a message for ``channel`` and schedule its dispatch if not already scheduled"""
+
+    window = app.config["SLACK_DISPATCH_WINDOW"]
+    client = app.redis
+    client.rpush(PENDING_KEY.format(channel), json.dumps(dict(kwargs, channel=channel)))
+    if client.set(SCHEDULED_KEY.format(channel), 1, nx=True, ex=int(window) + SCHEDULED_GRACE):
+        _schedule(channel, window)
+
+
+def _schedule(channel, countdown):
+    send_slack_messages.apply_async(args=[channel], countdown=countdown)
+
+
+def _pop_pending(client, channel):
+    key = PENDING_KEY.format(channel)
+    pipe = client.pipeline()
+    pipe.lrange(key, 0, -1)
+    pipe.delete(key)
+    messages, _deleted = pipe.execute()
+    return [json.loads(message) for message in messages]
+
+
+def _requeue(client, channel, messages, retry_after):
+    key = PENDING_KEY.format(channel)
+    pipe = client.pipeline()
+    for message in reversed(messages):
+        pipe.lpush(key, json.dumps(message))
+    pipe.set(SCHEDULED_KEY.format(channel), 1, ex=retry_after + SCHEDULED_GRACE)
+    pipe.execute()
+    _schedule(channel, retry_after)
+
+
+@celery.task(soft_time_limit=300)
+def send_slack_messages(channel):
+    client = app.redis
+
+    blocked_until = float(client.get(RETRY_AFTER_KEY) or 0)
+    if blocked_until > time.time():
+        retry_after = int(blocked_until - time.time()) + 1
+        client.set(SCHEDULED_KEY.format(channel), 1, ex=retry_after + SCHEDULED_GRACE)
+        _schedule(channel, retry_after)
+        return
+
+    # Clear the marker before draining, so messages queued from now on schedule a new run
+    client.delete(SCHEDULED_KEY.format(channel))
+    messages = _pop_pending(client, channel)
+    if not messages:
+        return
+
+    web_client = SlackWebClient(app.config["SLACK_BOT_TOKEN"], app.config["SLACK_API_URL"])
+    batches = merge_messages(messages, app.config["SLACK_DISPATCH_MAX_LENGTH"])
+    sent = 0
+    for batch in batches:
+        try:
+            web_client.post_message(**batch)
+        except SlackRateLimited as ex:
+            logger.warning(f"Slack rate limit hit, delaying {len(batches) - sent} message(s) by {ex.retry_after}s")
+            client.set(RETRY_AFTER_KEY, time.time() + ex.retry_after, ex=ex.retry_after)
+            _requeue(client, channel, batches[sent:], ex.retry_after)
+            return
+        except requests.RequestException as ex:
+            logger.exception(f"Failed to send Slack message to '{channel}': {ex}")
+        sent += 1
+
+    logger.info(f"Sent {len(messages)} Slack message(s) to '{channel}' in {sent} request(s)")
+
+
+def init_app(app):
+    if not app.config.get("SLACK_DISPATCH_ENABLED") or not app.config.get("SLACK_BOT_TOKEN"):
+        return
+
+    try:
+        from planning import planning_notifications
+    except ImportError:
+        return
+
+    if hasattr(planning_notifications, "SlackClient"):
+        planning_notifications.SlackClient = DispatchingSlackClient
+    else:
+        logger.warning("Unable to enable Slack dispatcher, planning does not use SlackClient directly")
@@ -0,0 +1,29 @@
+import math
+
+
+def percentile(values, pct):
+    """Return the ``pct`` percentile of ``values`` using the nearest-rank method"""
+
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize_latencies(values, percentiles=(50, 90, 99)):
+    """Return count, percentiles and max of the ``values`` (in ms) as a dict"""
+
+    summary = {"count": len(values)}
+    for pct in percentiles:
+        summary[f"p{pct}"] = percentile(values, pct)
+    summary["max"] = max(values) if values else None
+    return summary
+
+
+def format_latencies(summary):
+    return " ".join(
+        "{}={}".format(key, value if key == "count" or value is None else "{:.1f}ms".format(value))
+        for key, value in summary.items()
+    )
@@ -0,0 +1,117 @@
+"""Warm-up of gunicorn and Celery worker processes
+
+A new worker pays for its first database connections, the compiled ``replace_words`` patterns,
+the author users (if cached, see ``CROSSREF_USER_CACHE_TTL``) and the first Crossref document on
+its first requests or tasks. With
+``WORKER_WARMUP_ENABLED`` these are done when the worker starts instead: from ``post_worker_init``
+in ``gunicorn_config.py`` and ``worker_process_init`` in ``worker.py``.
+
+Every step is optional, a failed step is logged and the worker starts anyway. The content API
+does not get the ``WORKER_WARMUP_*`` settings, so its workers are not warmed up.
+"""
+
+import logging
+import time
+from datetime import timedelta
+
+from superdesk.utc import utcnow
+from macros.replace_words import get_compiled_words, get_replace_words
+from tga.publish.formatters.crossref import CrossrefFormatter
+
+logger = logging.getLogger(__name__)
+
+MONGO_PREFIXES = ("MONGO", "ARCHIVED", "LEGAL_ARCHIVE")
+
+
+def warm_up(app):
+    """Run the warm-up steps for ``app``, return the time of each step in ms"""
+
+    if not app.config.get("WORKER_WARMUP_ENABLED"):
+        return {}
+
+    steps = [("mongo", warm_up_mongo), ("elastic", warm_up_elastic), ("redis", warm_up_redis)]
+    if "publish_queue" in app.config.get("DOMAIN", {}):
+        steps += [("macros", warm_up_macros), ("users", warm_up_users), ("crossref", warm_up_crossref)]
+
+    start = time.perf_counter()
+    timings = {}
+    with app.app_context():
+        for name, step in steps:
+            step_start = time.perf_counter()
+            try:
+                step(app)
+            except Exception:
+                logger.exception(f"Worker warm-up step {name} failed")
+            timings[name] = (time.perf_counter() - step_start) * 1000
+
+    logger.info(
+        "Worker warm-up done in {:.0f}ms ({})".format(
+            (time.perf_counter() - start) * 1000,
+            " ".join("{}={:.0f}ms".format(name, timing) for name, timing in timings.items()),
+        )
+    )
+    return timings
+
+
+def warm_up_mongo(app):
+    for prefix in MONGO_PREFIXES:
+        if app.config.get(prefix + "_URI"):
+            app.data.mongo.pymongo(prefix=prefix).db.command("ping")
+
+
+def warm_up_elastic(app):
+    app.data.elastic.es.ping()
+
+
+def warm_up_redis(app):
+    if getattr(app, "redis", None) is not None:
+        app.redis.ping()
+
+
+def warm_up_macros(app):
+    words_list = get_replace_words()
+    if words_list:
+        get_compiled_words(words_list)
+
+
+def warm_up_users(app):
+    """Load the users of the most frequent authors of recently published items to the formatter cache
+
+    Does nothing unless ``CROSSREF_USER_CACHE_TTL`` is set, as the formatter does not use the cache then.
+    """
+
+    limit = app.config.get("WORKER_WARMUP_AUTHORS", 0)
+    if not limit or not app.config.get("CROSSREF_USER_CACHE_TTL"):
+        return
+
+    since = utcnow() - timedelta(days=app.config.get("WORKER_WARMUP_AUTHORS_DAYS", 90))
+    authors = app.data.get_mongo_collection("published").aggregate(
+        [
+            {"$match": {"versioncreated": {"$gte": since}, "authors.parent": {"$exists": True}}},
+            {"$unwind": "$authors"},
+            {"$group": {"_id": "$authors.parent", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}},
+            {"$limit": limit},
+        ],
+        # Celery gives ``worker_process_init`` handlers 4 seconds
+        maxTimeMS=2000,
+    )
+    user_ids = [author["_id"] for author in authors if author["_id"]]
+    users = app.data.get_mongo_collection("users").find({"_id": {"$in": user_ids}}, {"first_name": 1, "last_name": 1})
+    for user in users:
+        CrossrefFormatter.user_cache.set(user["_id"], user)
+
+
+def warm_up_crossref(app):
+    """Render a Crossref document, building the lxml and formatter structures"""
+
+    # without ``_current_version`` the document is not added to the output cache
+    CrossrefFormatter().format_document(
+        {
+            "_id": "tga-warm-up",
+            "type": "text",
+            "headline": "Warm-up",
+            "versioncreated": utcnow(),
+            "extra": {"doi": "10.0000/warm-up"},
+        }
+    )
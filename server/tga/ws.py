@@ -0,0 +1,132 @@
+"""Websocket server runner supporting several server processes
+
+Every process is a regular superdesk websocket server. Each one binds its own queue to the
+``socket_notification`` fanout exchange, so each process receives every notification and
+broadcasts it to the clients connected to it.
+
+Processes either share ``WS_PORT`` using ``SO_REUSEPORT`` (the kernel balances new connections
+between them), or listen on consecutive ports starting at ``WS_PORT`` behind a load balancer.
+
+Notifications of events in ``WS_COALESCE_EVENTS`` are merged before the broadcast,
+see :mod:`tga.ws_coalescing`.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import signal
+from threading import Thread
+
+import websockets
+from superdesk.websockets_comms import SocketCommunication as _SocketCommunication, SocketMessageConsumer
+
+from tga.ws_coalescing import NotificationCoalescer
+
+logger = logging.getLogger(__name__)
+
+
+class SocketCommunication(_SocketCommunication):
+    def __init__(self, host, port, broker_url, exchange_name=None, reuse_port=False, coalesce_events=None):
+        super().__init__(host, port, broker_url, exchange_name)
+        self.reuse_port = reuse_port
+        self.loop = None
+        self.coalescer = NotificationCoalescer(coalesce_events, self._schedule, self._send_coalesced)
+
+        # coalesced events are merged instead of being dropped by the ``event_interval`` throttle
+        for event in self.coalescer.windows:
+            self.event_interval.pop(event, None)
+
+    def _schedule(self, delay, callback):
+        # called from the broker consumer thread, timers must run on the server loop
+        self.loop.call_soon_threadsafe(self.loop.call_later, delay, callback)
+
+    def _send_coalesced(self, message):
+        asyncio.ensure_future(super().broadcast(message), loop=self.loop)
+
+    async def broadcast(self, message):
+        if self.loop is not None and self.coalescer.add(message):
+            return
+        await super().broadcast(message)
+
+    def run_server(self):
+        """Create websocket server and run it until it gets Ctrl+C or SIGTERM.
+
+        Same as the superdesk implementation, with optional ``SO_REUSEPORT`` on the listening socket.
+        """
+        server = None
+        consumer = None
+        loop = self.loop = asyncio.get_event_loop()
+        try:
+            server = loop.run_until_complete(
+                websockets.serve(self._connection_handler, self.host, self.port, reuse_port=self.reuse_port or None)
+            )
+            loop.add_signal_handler(signal.SIGTERM, loop.stop)
+            logger.info("listening on %s:%s" % (self.host, self.port))
+            consumer = SocketMessageConsumer(self.broker_url, self.broadcast, self.exchange_name)
+            consumer_thread = Thread(target=consumer.run)
+            consumer_thread.start()
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            logger.info("closing server")
+            self.coalescer.flush_all()
+            if server:
+                server.close()
+                loop.run_until_complete(server.wait_closed())
+            loop.stop()
+            loop.run_forever()
+            loop.close()
+            if consumer:
+                consumer.close()
+
+
+def create_server(config):
+    """Create websocket server and run it until it gets Ctrl+C or SIGTERM.
+
+    :param config: config dictionary
+    """
+    try:
+        comms = SocketCommunication(
+            config["WS_HOST"],
+            int(config["WS_PORT"]),
+            config["BROKER_URL"],
+            config.get("WEBSOCKET_EXCHANGE"),
+            reuse_port=config.get("WS_REUSE_PORT", False),
+            coalesce_events=config.get("WS_COALESCE_EVENTS"),
+        )
+        comms.run_server()
+    except Exception:
+        logger.exception("Failed to start the WebSocket server.")
+
+
+def run_servers(config):
+    """Run ``WS_PROCESSES`` websocket servers and wait for them to finish.
+
+    :param config: config dictionary
+    """
+    processes = int(config.get("WS_PROCESSES") or 1)
+    if processes <= 1:
+        create_server(config)
+        return
+
+    port = int(config["WS_PORT"])
+    workers = []
+    for index in range(processes):
+        worker_config = dict(config)
+        if not config.get("WS_REUSE_PORT"):
+            worker_config["WS_PORT"] = port + index
+        worker = multiprocessing.Process(target=create_server, args=(worker_config,), name=f"ws-{index}")
+        worker.start()
+        logger.info(f"Started websocket server {worker.name} pid={worker.pid} port={worker_config['WS_PORT']}")
+        workers.append(worker)
+
+    def stop(_signum, _frame):
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for worker in workers:
+        worker.join()
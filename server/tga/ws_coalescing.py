@@ -0,0 +1,133 @@
+"""Coalescing of websocket notifications
+
+Bulk operations (mass resend, data updates) push one notification per item. For events
+configured in ``WS_COALESCE_EVENTS`` the websocket server buffers notifications of the same
+event for a short window and broadcasts merged messages instead.
+
+Only notifications with the same scalar values are merged, so the merged message keeps the
+shape the client reads:
+
+* dict values (like ``items`` of ``content:update``) are merged,
+* list values are concatenated without duplicates,
+* scalar values (like ``item`` of ``item:publish``) are the same in every merged notification,
+
+and adds ``ids`` with every item id found in the merged notifications and ``coalesced``
+with the number of merged notifications. Notifications of events with a scalar item id are
+only merged when they are about the same item, so only events like ``content:update`` should
+be configured.
+"""
+
+import json
+import logging
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+#: ``extra`` fields holding the id of a single item
+ID_FIELDS = ("item", "item_id", "queue_id", "_id", "id")
+
+
+def group_notifications(messages):
+    """Group decoded notifications which can be merged without losing values, keeping their order"""
+
+    groups = {}
+    for message in messages:
+        scalars = {
+            key: value for key, value in (message.get("extra") or {}).items() if not isinstance(value, (dict, list))
+        }
+        groups.setdefault(json.dumps(scalars, sort_keys=True, default=str), []).append(message)
+    return list(groups.values())
+
+
+def merge_notifications(messages):
+    """Merge decoded notifications of the same event into one"""
+
+    extra = {}
+    ids = []
+    for message in messages:
+        for key, value in (message.get("extra") or {}).items():
+            if isinstance(value, dict):
+                extra.setdefault(key, {})
+                if isinstance(extra[key], dict):
+                    extra[key].update(value)
+                else:
+                    extra[key] = value
+                if key == "items":
+                    ids.extend(value.keys())
+            elif isinstance(value, list):
+                previous = extra.get(key) if isinstance(extra.get(key), list) else []
+                extra[key] = previous + [v for v in value if v not in previous]
+                if key in ID_FIELDS:
+                    ids.extend(value)
+            else:
+                extra[key] = value
+                if key in ID_FIELDS and value is not None:
+                    ids.append(value)
+
+    extra["ids"] = list(dict.fromkeys(str(_id) for _id in ids))
+    extra["coalesced"] = len(messages)
+
+    merged = dict(messages[-1])
+    merged["extra"] = extra
+    return merged
+
+
+class NotificationCoalescer:
+    """Buffer notifications per event and flush them once their window elapses
+
+    :param windows: dict of event name and window in seconds
+    :param schedule: ``schedule(delay, callback)`` used to run the flush later
+    :param send: called with each merged (encoded) message on flush
+    """
+
+    def __init__(self, windows, schedule, send):
+        self.windows = {event: float(window) for event, window in (windows or {}).items() if window}
+        self.schedule = schedule
+        self.send = send
+        self.pending = {}
+        self.lock = Lock()
+
+    def add(self, message):
+        """Buffer the encoded ``message`` if its event is coalesced
+
+        :return: ``True`` if the message was buffered, ``False`` if it should be sent as it is
+        """
+
+        if not self.windows:
+            return False
+
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return False
+
+        event = data.get("event")
+        if event not in self.windows:
+            return False
+
+        with self.lock:
+            first = event not in self.pending
+            self.pending.setdefault(event, []).append(data)
+
+        if first:
+            self.schedule(self.windows[event], lambda: self.flush(event))
+        return True
+
+    def flush(self, event):
+        with self.lock:
+            messages = self.pending.pop(event, None)
+
+        if not messages:
+            return
+
+        for group in group_notifications(messages):
+            if len(group) == 1:
+                merged = group[0]
+            else:
+                logger.info(f"Coalesced {len(group)} '{event}' notifications")
+                merged = merge_notifications(group)
+            self.send(json.dumps(merged))
+
+    def flush_all(self):
+        for event in list(self.pending):
+            self.flush(event)
@@ -0,0 +1,170 @@
+"""Websocket notification fan-out load test
+
+Opens many client connections to the websocket server(s), pushes notifications through the
+broker the same way backend processes do, and measures the latency from publishing a message
+until each client receives it.
+
+Usage (from the ``server`` directory)::
+
+    python -m tga.ws_loadtest --clients 2000 --messages 20
+    python -m tga.ws_loadtest --url ws://localhost:5100 --url ws://localhost:5101 --clients 4000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import resource
+import time
+from datetime import datetime
+from itertools import cycle
+from threading import Thread
+
+import websockets
+from superdesk.websockets_comms import SocketMessageProducer
+
+from settings import WS_PORT, BROKER_URL
+from tga.utils import summarize_latencies, format_latencies
+
+logger = logging.getLogger(__name__)
+
+EVENT = "tga:ws_loadtest"
+
+
+class LoadTest:
+    def __init__(self, urls, clients, messages, interval, broker_url, connect_concurrency=100, timeout=30):
+        self.urls = urls
+        self.clients = clients
+        self.messages = messages
+        self.interval = interval
+        self.broker_url = broker_url
+        self.connect_concurrency = connect_concurrency
+        self.timeout = timeout
+        self.latencies = []
+        self.last_received = {}
+        self.sent_at = {}
+        self.connected = 0
+        self.failed = 0
+
+    async def _connect(self, url, semaphore):
+        async with semaphore:
+            try:
+                websocket = await websockets.connect(url, timeout=self.timeout)
+            except Exception as ex:
+                logger.debug(f"Failed to connect to {url}: {ex}")
+                self.failed += 1
+                return None
+        self.connected += 1
+        return websocket
+
+    async def _listen(self, websocket, deadline):
+        received = 0
+        loop = asyncio.get_event_loop()
+        while received < self.messages and loop.time() < deadline:
+            try:
+                message = await asyncio.wait_for(websocket.recv(), deadline - loop.time())
+            except (asyncio.TimeoutError, websockets.ConnectionClosed):
+                break
+
+            now = time.time()
+            data = json.loads(message)
+            if data.get("event") != EVENT:
+                continue
+
+            seq = data["extra"]["seq"]
+            self.latencies.append((now - data["extra"]["sent"]) * 1000)
+            self.last_received[seq] = max(self.last_received.get(seq, 0), now)
+            received += 1
+
+        await websocket.close()
+
+    def _send(self):
+        producer = SocketMessageProducer(self.broker_url)
+        try:
+            for seq in range(self.messages):
+                sent = time.time()
+                self.sent_at[seq] = sent
+                message = {"event": EVENT, "extra": {"seq": seq, "sent": sent}}
+                message["_created"] = datetime.utcnow().isoformat()
+                producer.send(json.dumps(message))
+                time.sleep(self.interval)
+        finally:
+            producer.close()
+
+    async def _run(self):
+        semaphore = asyncio.Semaphore(self.connect_concurrency)
+        urls = cycle(self.urls)
+        started = time.time()
+        websockets_ = await asyncio.gather(*[self._connect(next(urls), semaphore) for _ in range(self.clients)])
+        websockets_ = [websocket for websocket in websockets_ if websocket is not None]
+        logger.info(f"Connected {self.connected} client(s) in {time.time() - started:.1f}s, {self.failed} failed")
+
+        deadline = asyncio.get_event_loop().time() + self.messages * self.interval + self.timeout
+        listeners = asyncio.gather(*[self._listen(websocket, deadline) for websocket in websockets_])
+
+        # give the server a moment to register the clients before pushing
+        await asyncio.sleep(1)
+        sender = Thread(target=self._send)
+        sender.start()
+        await listeners
+        sender.join()
+
+    def run(self):
+        asyncio.get_event_loop().run_until_complete(self._run())
+        return self.report()
+
+    def report(self):
+        expected = self.connected * self.messages
+        fan_out = [(self.last_received[seq] - self.sent_at[seq]) * 1000 for seq in self.last_received]
+        return {
+            "clients": self.connected,
+            "failed_connections": self.failed,
+            "expected": expected,
+            "received": len(self.latencies),
+            "latency": summarize_latencies(self.latencies),
+            "fan_out": summarize_latencies(fan_out),
+        }
+
+
+def raise_open_files_limit(clients):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = clients + 256
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+        if hard < wanted:
+            logger.warning(f"Open files limit is {hard}, not all {clients} clients may connect")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", action="append", dest="urls", help="websocket url, can be repeated")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between messages")
+    parser.add_argument("--broker-url", default=BROKER_URL)
+    parser.add_argument("--connect-concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    raise_open_files_limit(args.clients)
+    load_test = LoadTest(
+        args.urls or ["ws://localhost:{}".format(WS_PORT)],
+        args.clients,
+        args.messages,
+        args.interval,
+        args.broker_url,
+        args.connect_concurrency,
+    )
+    result = load_test.run()
+
+    logger.info(
+        "clients={clients} failed_connections={failed_connections} expected={expected} received={received}".format(
+            **result
+        )
+    )
+    logger.info("delivery latency: " + format_latencies(result["latency"]))
+    logger.info("fan-out (publish to last client): " + format_latencies(result["fan_out"]))
+
+
+if __name__ == "__main__":
+    main()
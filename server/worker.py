@@ -11,8 +11,16 @@
 
 
 import logging
+from celery.signals import worker_process_init
 from app import get_app
+from tga.warmup import warm_up
 
 
 logger = logging.getLogger(__name__)
-celery = get_app().celery
+app = get_app()
+celery = app.celery
+
+
+@worker_process_init.connect
+def warm_up_worker(**_kwargs):
+    warm_up(app)
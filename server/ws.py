@@ -10,13 +10,20 @@
 # at https://www.sourcefabric.org/superdesk/license
 
 import logging
-from settings import WS_HOST, WS_PORT, LOG_CONFIG_FILE, BROKER_URL
-from superdesk.ws import create_server
+from settings import WS_HOST, WS_PORT, WS_PROCESSES, WS_REUSE_PORT, WS_COALESCE_EVENTS, LOG_CONFIG_FILE, BROKER_URL
 from superdesk.logging import configure_logging
+from tga.ws import run_servers
 
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
-    config = {"WS_HOST": WS_HOST, "WS_PORT": WS_PORT, "BROKER_URL": BROKER_URL}
+    config = {
+        "WS_HOST": WS_HOST,
+        "WS_PORT": WS_PORT,
+        "WS_PROCESSES": WS_PROCESSES,
+        "WS_REUSE_PORT": WS_REUSE_PORT,
+        "WS_COALESCE_EVENTS": WS_COALESCE_EVENTS,
+        "BROKER_URL": BROKER_URL,
+    }
     configure_logging(LOG_CONFIG_FILE)
-    create_server(config)
+    run_servers(config)